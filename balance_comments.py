@@ -1,102 +1,235 @@
 #!/usr/bin/env python3
 """
 Script to analyze and balance comment datasets.
-Reads all JSON files from the comments folder, provides statistics,
-and creates a balanced dataset with equal numbers of resolved and unresolved comments.
+Reads all JSON and JSON Lines files from the comments folder, provides statistics,
+and creates a balanced dataset (written as JSON Lines) with equal numbers of resolved and unresolved comments.
 """
 
-import json
 import os
-import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
 
+import ijson
+import numpy as np
+import orjson
 from tqdm import tqdm
 
 # =========================
 # Configuration Constants
 # =========================
 
-# Input directory containing comment JSON files
+# Input directory containing comment JSON or JSONL files
 INPUT_DIR = "/home/vahid/Desktop/CommentCheck/files/comments"
 
 # Output directory for balanced datasets
 OUTPUT_DIR = "/home/vahid/Desktop/CommentCheck/files/comments_balanced"
 
+# Comment files written by the scraper; the `*_pull_requests.jsonl` files it
+# writes next to them hold PR records, not comments, and are skipped
+COMMENT_FILE_SUFFIXES = ("_comments.jsonl", "_comments.json")
+
 # Random seed for reproducibility
 RANDOM_SEED = 42
 
+# How the majority class is sampled down:
+#   "simple": uniform random sample over all majority comments
+#   "stratified": each PR (`pullRequestNumber`) contributes in proportion to its
+#                 share of the majority class, so a few chatty PRs cannot dominate
+BALANCE_MODE = "simple"
+
+# Buffer size for reading and writing comment files (fewer syscalls on large files)
+IO_BUFFER_SIZE = 1 << 20
+
+
+def load_comments_file(file_path: Path) -> Iterator[Dict[str, Any]]:
+    """Stream comments one at a time from a JSON array or JSON Lines file."""
+    with open(file_path, 'rb', buffering=IO_BUFFER_SIZE) as f:
+        if file_path.suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+        else:
+            yield from ijson.items(f, 'item', use_float=True)
+
+
+def load_field_array(file_path: Path, field: str, dtype: Any, default: Any) -> np.ndarray:
+    """
+    Stream a single field of every comment in a JSON or JSON Lines file into an
+    array, using `default` for comments without the field, so position i in the
+    result always corresponds to the i-th comment in the file.
+    """
+    values = (comment.get(field, default) for comment in load_comments_file(file_path))
+    return np.fromiter(values, dtype=dtype)
+
 
-def load_comments_file(file_path: Path) -> List[Dict[str, Any]]:
-    """Load comments from a JSON file."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def save_comments_file(comments: Iterable[Dict[str, Any]], file_path: Path) -> None:
+    """
+    Save comments to a JSON Lines file, one comment per line. The file is written
+    next to its destination and renamed into place, so an interrupted run never
+    leaves a truncated output behind.
+    """
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    with open(tmp_path, 'wb', buffering=IO_BUFFER_SIZE) as f:
+        for comment in comments:
+            f.write(orjson.dumps(comment, option=orjson.OPT_APPEND_NEWLINE))
+    os.replace(tmp_path, file_path)
 
 
-def save_comments_file(comments: List[Dict[str, Any]], file_path: Path) -> None:
-    """Save comments to a JSON file."""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(comments, f, indent=2, ensure_ascii=False)
+def is_up_to_date(output_file: Path, input_file: Path) -> bool:
+    """Return True if output_file exists and is not older than input_file."""
+    try:
+        return output_file.stat().st_mtime >= input_file.stat().st_mtime
+    except FileNotFoundError:
+        return False
 
 
-def analyze_comments(comments: List[Dict[str, Any]]) -> Dict[str, int]:
-    """Count resolved and unresolved comments."""
-    resolved = sum(1 for comment in comments if comment.get("resolved", False))
-    unresolved = len(comments) - resolved
-    return {
-        "resolved": resolved,
-        "unresolved": unresolved,
-        "total": len(comments)
+def analyze_and_partition(resolved_mask: np.ndarray) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    """
+    Count resolved and unresolved comments and partition their indices using the
+    boolean resolved mask. Returns (stats, resolved_indices, unresolved_indices).
+    """
+    resolved_indices = np.flatnonzero(resolved_mask)
+    unresolved_indices = np.flatnonzero(~resolved_mask)
+    
+    stats = {
+        "resolved": len(resolved_indices),
+        "unresolved": len(unresolved_indices),
+        "total": len(resolved_mask)
     }
+    return stats, resolved_indices, unresolved_indices
+
+
+def stratified_choice(strata: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Choose `size` positions out of `len(strata)` without replacement so that every
+    stratum gets a share proportional to its size. Shares are rounded with the
+    largest remainder method, so exactly `size` positions are returned.
+    """
+    _, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    quotas = size * counts / len(strata)
+    allocation = np.floor(quotas).astype(np.intp)
+    remainder = size - int(allocation.sum())
+    allocation[np.argsort(allocation - quotas, kind="stable")[:remainder]] += 1
+    
+    # Positions grouped by stratum, in the order of `counts`
+    grouped = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(counts)[:-1]
+    chosen = [
+        members[rng.choice(len(members), size=k, replace=False, shuffle=False)]
+        for members, k in zip(np.split(grouped, bounds), allocation)
+        if k
+    ]
+    return np.concatenate(chosen) if chosen else np.empty(0, dtype=np.intp)
 
 
-def balance_comments(comments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Create a balanced dataset with equal numbers of resolved and unresolved comments."""
-    resolved_comments = [c for c in comments if c.get("resolved", False)]
-    unresolved_comments = [c for c in comments if not c.get("resolved", False)]
-    
-    resolved_count = len(resolved_comments)
-    unresolved_count = len(unresolved_comments)
-    
-    # Determine which class is the minority
-    if resolved_count < unresolved_count:
-        # Resolved is minority, sample from unresolved
-        target_count = resolved_count
-        sampled_unresolved = random.sample(unresolved_comments, target_count)
-        balanced_comments = resolved_comments + sampled_unresolved
-    elif unresolved_count < resolved_count:
-        # Unresolved is minority, sample from resolved
-        target_count = unresolved_count
-        sampled_resolved = random.sample(resolved_comments, target_count)
-        balanced_comments = sampled_resolved + unresolved_comments
+def balance_comments(
+    resolved_indices: np.ndarray,
+    unresolved_indices: np.ndarray,
+    rng: np.random.Generator,
+    strata: Optional[np.ndarray] = None,
+) -> List[int]:
+    """
+    Select the comment indices of a balanced dataset with equal numbers of
+    resolved and unresolved comments, in shuffled order. Only the indices are
+    needed, so the comment bodies never have to be held in memory at the same time.
+    If `strata` (one label per comment, e.g. its PR number) is given, the majority
+    class is sampled proportionally within each stratum instead of uniformly.
+    """
+    # Keep the whole minority class and sample the majority down to its size
+    if len(resolved_indices) < len(unresolved_indices):
+        minority, majority = resolved_indices, unresolved_indices
+    else:
+        minority, majority = unresolved_indices, resolved_indices
+    target_count = len(minority)
+    
+    if strata is not None:
+        sampled = stratified_choice(strata[majority], target_count, rng)
     else:
-        # Already balanced
-        balanced_comments = comments
+        sampled = rng.choice(len(majority), size=target_count, replace=False, shuffle=False)
+    balanced_indices = np.empty(2 * target_count, dtype=np.intp)
+    balanced_indices[:target_count] = minority
+    balanced_indices[target_count:] = majority[sampled]
     
-    # Shuffle to avoid ordering bias
-    random.shuffle(balanced_comments)
+    # Shuffle the indices (not the comments) to avoid ordering bias
+    rng.shuffle(balanced_indices)
     
-    return balanced_comments
+    return balanced_indices.tolist()
+
+
+def collect_balanced_comments(file_path: Path, balanced_indices: List[int]) -> List[Dict[str, Any]]:
+    """Stream the file a second time, keeping only the selected comments (in selection order)."""
+    wanted = set(balanced_indices)
+    selected: Dict[int, Dict[str, Any]] = {}
+    for i, comment in enumerate(load_comments_file(file_path)):
+        if i in wanted:
+            selected[i] = comment
+    
+    return [selected[i] for i in balanced_indices]
+
+
+def process_comments_file(json_file: Path, output_path: Path, seed: int) -> Tuple[str, Dict[str, int]]:
+    """
+    Analyze and balance a single comment file, saving the result under output_path.
+    Runs in a worker process; the RNG is derived from the seed and the file name
+    so results are reproducible regardless of scheduling order.
+    """
+    rng = np.random.default_rng(seed ^ zlib.crc32(json_file.name.encode("utf-8")))
+    
+    # First pass: read only the resolved flags (and PR numbers for stratified sampling)
+    resolved_mask = load_field_array(json_file, "resolved", bool, False)
+    stats, resolved_indices, unresolved_indices = analyze_and_partition(resolved_mask)
+    
+    # An already balanced input keeps all of its comments, so an output written
+    # after the input was last modified can be reused as is
+    output_file = output_path / f"{json_file.stem}.jsonl"
+    if stats["resolved"] == stats["unresolved"] and is_up_to_date(output_file, json_file):
+        return json_file.name, stats
+    
+    strata = None
+    if BALANCE_MODE == "stratified":
+        strata = load_field_array(json_file, "pullRequestNumber", np.int64, -1)
+    
+    # Create balanced dataset; second pass keeps only the selected comments
+    balanced_indices = balance_comments(resolved_indices, unresolved_indices, rng, strata)
+    balanced_comments = collect_balanced_comments(json_file, balanced_indices)
+    
+    # Save balanced dataset with same base name as JSON Lines
+    save_comments_file(balanced_comments, output_file)
+    
+    return json_file.name, stats
 
 
 def main():
     """Main function to process all comment files."""
-    # Set random seed for reproducibility
-    random.seed(RANDOM_SEED)
-    
     # Create output directory if it doesn't exist
     output_path = Path(OUTPUT_DIR)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Get all JSON files from input directory
-    input_path = Path(INPUT_DIR)
-    json_files = list(input_path.glob("*.json"))
+    # Get all comment JSON and JSON Lines files from input directory, one per
+    # stem: both formats are written to {stem}.jsonl, so when an old
+    # `X_comments.json` sits next to a newer `X_comments.jsonl` only the latter is used
+    files_by_stem: Dict[str, Path] = {}
+    with os.scandir(INPUT_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(COMMENT_FILE_SUFFIXES) or not entry.is_file(follow_symlinks=False):
+                continue
+            path = Path(entry.path)
+            existing = files_by_stem.get(path.stem)
+            if existing is None or path.suffix == ".jsonl":
+                files_by_stem[path.stem] = path
+            if existing is not None:
+                skipped = path if path.suffix != ".jsonl" else existing
+                print(f"Skipping {skipped.name}: superseded by {files_by_stem[path.stem].name}")
+    json_files = sorted(files_by_stem.values())
     
     if not json_files:
-        print(f"No JSON files found in {INPUT_DIR}")
+        print(f"No comment JSON or JSONL files found in {INPUT_DIR}")
         return
     
-    print(f"Found {len(json_files)} JSON file(s) to process\n")
+    print(f"Found {len(json_files)} comment file(s) to process\n")
     
     # Overall statistics
     total_resolved = 0
@@ -104,24 +237,16 @@ def main():
     total_comments = 0
     file_stats = []
     
-    # Process each file
-    for json_file in tqdm(json_files, desc="Processing files", unit="file"):
-        # Load comments
-        comments = load_comments_file(json_file)
-        
-        # Analyze current file
-        stats = analyze_comments(comments)
-        total_resolved += stats["resolved"]
-        total_unresolved += stats["unresolved"]
-        total_comments += stats["total"]
-        file_stats.append((json_file.name, stats))
-        
-        # Create balanced dataset
-        balanced_comments = balance_comments(comments)
-        
-        # Save balanced dataset with same filename
-        output_file = output_path / json_file.name
-        save_comments_file(balanced_comments, output_file)
+    # Process files in parallel; each file is independent
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(
+            process_comments_file, json_files, repeat(output_path), repeat(RANDOM_SEED), chunksize=4
+        )
+        for filename, stats in tqdm(results, total=len(json_files), desc="Processing files", unit="file"):
+            total_resolved += stats["resolved"]
+            total_unresolved += stats["unresolved"]
+            total_comments += stats["total"]
+            file_stats.append((filename, stats))
     
     # Print per-file statistics
     print("\n" + "="*60)
@@ -1,22 +1,25 @@
 import os
-import json
+import queue
 import re
 import shutil
 import subprocess
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime, timezone, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, TextIO
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 
+import orjson
 import requests
 from dotenv import load_dotenv
-from limits import parse_many
-from limits.storage import MemoryStorage
-from limits.strategies import FixedWindowRateLimiter
 from tqdm import tqdm
 
+from diff_cache import DiffCache
+from github_backoff import backoff_for
+from graphql_cache import GraphQLCache
+
 
 # =========================
 # Configuration
@@ -28,12 +31,33 @@ GITHUB_API_URL = "https://api.github.com/graphql"
 # Path to the repos list (one `owner/repo` per line)
 REPOS_LIST_PATH = "/home/vahid/Desktop/CommentCheck/files/repos.txt"
 
-# Output directory (one JSON per repo)
+# Output directory (one comments JSONL and one pull requests JSONL per repo)
 OUTPUT_DIR = "/home/vahid/Desktop/CommentCheck/files/comments"
 
+# Write buffer size for the output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Flush the output files once at least this many comments were written since the
+# last flush (always at a PR boundary). Bounds what is lost if the script dies.
+OUTPUT_FLUSH_INTERVAL = 500
+
+# Maximum number of PRs (with their comments) waiting for the writer thread.
+# Bounds memory when serialising falls behind fetching.
+OUTPUT_QUEUE_SIZE = 64
+
 # Directory for cloned git repositories
 CLONES_DIR = "/home/vahid/Desktop/CommentCheck/files/clones"
 
+# SQLite file caching PR diffs by (base commit, head commit) across runs.
+# Set to None to disable the cache.
+DIFF_CACHE_PATH: Optional[str] = "/home/vahid/Desktop/CommentCheck/files/diff_cache.sqlite3"
+
+# SQLite file caching GraphQL responses by (query, variables) across runs, so
+# re-runs skip pages fetched less than GRAPHQL_CACHE_TTL seconds ago.
+# Set to None to disable the cache.
+GRAPHQL_CACHE_PATH: Optional[str] = "/home/vahid/Desktop/CommentCheck/files/graphql_cache.sqlite3"
+GRAPHQL_CACHE_TTL = 24 * 60 * 60
+
 # Maximum number of comments per repo to collect.
 # If set to None, script will collect all available comments.
 MAX_COMMENTS_PER_REPO: Optional[int] = 1000
@@ -43,13 +67,23 @@ MAX_COMMENTS_PER_REPO: Optional[int] = 1000
 PR_CREATED_BEFORE_ISO = "2025-12-01T00:00:00Z"
 
 # GraphQL pagination sizes – tuned to reduce number of requests.
-PRS_PER_PAGE = 25
+# A listing query costs (1 + PRS + PRS * THREADS) / 100 rate-limit points, so more
+# PRs per page cut the number of requests without raising the points spent per
+# PR. Raising THREADS_PER_PAGE instead would multiply the cost of every page for
+# the few PRs with many threads, which are paged per PR anyway. Node count:
+# 100 + 100 * 25 + 100 * 25 * 50 = 127,600, well below GitHub's 500,000 limit.
+PRS_PER_PAGE = 100
 THREADS_PER_PAGE = 25
 COMMENTS_PER_THREAD_PAGE = 50
 
 # Number of parallel workers for processing repositories
 MAX_WORKERS = 4
 
+# Number of threads per repository worker used to prefetch PR diffs (REST API
+# requests or local `git diff` runs) while the main thread pages through threads.
+# Kept small to stay clear of GitHub's secondary (concurrency) rate limits.
+DIFF_PREFETCH_WORKERS = 8
+
 # Method to use for fetching PR diffs: "git" or "rest_api"
 # "git": Use local git repository (requires cloning repos, but avoids REST API rate limits)
 # "rest_api": Use GitHub REST API (no local repos needed, but uses API quota)
@@ -59,15 +93,57 @@ USE_GIT_FOR_DIFFS = True
 # Maximum requests per hour across all threads (set to 4800 to stay under 5000 limit)
 MAX_REQUESTS_PER_HOUR = 4800
 
-# Path to external GraphQL query template
+# Requests that may be sent back to back before throttling kicks in. At most
+# MAX_REQUESTS_PER_HOUR + RATE_LIMIT_BURST requests can go out in any hour.
+RATE_LIMIT_BURST = 100
+
+# Paths to external GraphQL query templates
 PR_THREADS_QUERY_PATH = "/home/vahid/Desktop/CommentCheck/queries/query_pull_request_threads.graphql"
+PR_REVIEW_THREADS_QUERY_PATH = "/home/vahid/Desktop/CommentCheck/queries/query_pull_request_review_threads.graphql"
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens refill continuously at `rate` per second up
+    to `capacity`; each request consumes one. Checking and consuming a token
+    happen atomically under a lock, so concurrent threads can never overshoot.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next `seconds` (e.g. until GitHub's quota resets)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available and return 0, otherwise return the
+        number of seconds until the next token becomes available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
 
 # Global rate limiter (shared across all threads)
 _rate_limiter_lock = threading.Lock()
-_rate_limiter: Optional[FixedWindowRateLimiter] = None
+_rate_limiter: Optional[TokenBucket] = None
 
 
-def get_rate_limiter() -> FixedWindowRateLimiter:
+def get_rate_limiter() -> TokenBucket:
     """
     Get or create the shared rate limiter instance.
     Thread-safe singleton pattern.
@@ -76,34 +152,110 @@ def get_rate_limiter() -> FixedWindowRateLimiter:
     if _rate_limiter is None:
         with _rate_limiter_lock:
             if _rate_limiter is None:
-                storage = MemoryStorage()
-                _rate_limiter = FixedWindowRateLimiter(storage)
+                _rate_limiter = TokenBucket(MAX_REQUESTS_PER_HOUR / 3600, RATE_LIMIT_BURST)
     return _rate_limiter
 
 
-def wait_for_rate_limit(limiter: FixedWindowRateLimiter, key: str = "github_api") -> None:
+# Global diff cache (shared across all threads)
+_diff_cache_lock = threading.Lock()
+_diff_cache: Optional[DiffCache] = None
+
+
+def get_diff_cache() -> Optional[DiffCache]:
+    """
+    Get or create the shared on-disk diff cache, or None if DIFF_CACHE_PATH is unset.
+    Thread-safe singleton pattern.
+    """
+    global _diff_cache
+    if DIFF_CACHE_PATH is None:
+        return None
+    if _diff_cache is None:
+        with _diff_cache_lock:
+            if _diff_cache is None:
+                _diff_cache = DiffCache(DIFF_CACHE_PATH)
+    return _diff_cache
+
+
+# Global GraphQL response cache (shared across all threads)
+_graphql_cache_lock = threading.Lock()
+_graphql_cache: Optional[GraphQLCache] = None
+
+
+def get_graphql_cache() -> Optional[GraphQLCache]:
+    """
+    Get or create the shared on-disk GraphQL response cache, or None if
+    GRAPHQL_CACHE_PATH is unset.
+    Thread-safe singleton pattern.
+    """
+    global _graphql_cache
+    if GRAPHQL_CACHE_PATH is None:
+        return None
+    if _graphql_cache is None:
+        with _graphql_cache_lock:
+            if _graphql_cache is None:
+                _graphql_cache = GraphQLCache(GRAPHQL_CACHE_PATH, GRAPHQL_CACHE_TTL)
+    return _graphql_cache
+
+
+# Global HTTP session (shared across all threads)
+_http_session_lock = threading.Lock()
+_http_session: Optional[requests.Session] = None
+
+
+def get_session(token: str) -> requests.Session:
+    """
+    Get or create the shared HTTP session used for all GitHub requests.
+    Thread-safe singleton pattern. Sharing one session keeps TLS connections
+    alive across GraphQL pages, REST pagination and repository workers.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                session.headers.update(
+                    {
+                        "Authorization": f"Bearer {token}",
+                        "Accept": "application/vnd.github+json",
+                        "Accept-Encoding": "gzip, deflate",
+                        "Connection": "keep-alive",
+                    }
+                )
+                # Every repo worker and each of its diff prefetch threads can hold
+                # a connection at the same time; size the pool so none is dropped.
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=2,
+                    pool_maxsize=MAX_WORKERS * (DIFF_PREFETCH_WORKERS + 1),
+                    pool_block=False,
+                )
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def wait_for_rate_limit(limiter: TokenBucket) -> None:
     """
     Wait if necessary to respect rate limits.
     Blocks until the request can be made without exceeding the limit.
     """
-    limit_str = f"{MAX_REQUESTS_PER_HOUR}/hour"
-    limits = parse_many(limit_str)
-    
-    for limit in limits:
-        if not limiter.test(limit, key):
-            # Calculate how long to wait
-            reset_time = limiter.get_window_stats(limit, key).reset_time
-            if reset_time:
-                wait_seconds = (reset_time - datetime.now()).total_seconds()
-                if wait_seconds > 0:
-                    time.sleep(wait_seconds)
-            else:
-                # Fallback: wait a small amount
-                time.sleep(0.1)
-    
-    # Hit the limit (increment counter)
-    for limit in limits:
-        limiter.hit(limit, key)
+    while True:
+        wait_seconds = limiter.try_acquire()
+        if wait_seconds <= 0:
+            return
+        time.sleep(wait_seconds)
+
+
+def note_rate_limit_headers(limiter: TokenBucket, response: requests.Response) -> None:
+    """
+    Pause the shared limiter until GitHub's reported reset time once the
+    `X-RateLimit-Remaining` header says the quota is used up, so no thread keeps
+    sending requests that are bound to be rejected.
+    """
+    if response.headers.get("X-RateLimit-Remaining") != "0":
+        return
+    reset = response.headers.get("X-RateLimit-Reset")
+    if reset and reset.isdigit():
+        limiter.pause(int(reset) - time.time())
 
 
 def parse_iso8601(dt: Optional[str]) -> Optional[datetime]:
@@ -113,7 +265,8 @@ def parse_iso8601(dt: Optional[str]) -> Optional[datetime]:
     """
     if not dt:
         return None
-    return datetime.strptime(dt, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    # fromisoformat only accepts a trailing "Z" from Python 3.11 on
+    return datetime.fromisoformat(dt.replace("Z", "+00:00"))
 
 
 def load_github_token() -> str:
@@ -130,41 +283,52 @@ def load_github_token() -> str:
 def graphql_request(session: requests.Session, query: str, variables: Dict[str, Any], max_retries: int = 3) -> Dict[str, Any]:
     """
     Send a GraphQL request with retry logic and rate limiting.
-    Retries on failures with 1 second delay between attempts.
+    Retries on failures after the delay given by backoff_for.
+    Responses are served from and stored in the GraphQL cache when enabled.
     """
+    cache = get_graphql_cache()
+    if cache is not None:
+        cached = cache.get(query, variables)
+        if cached is not None:
+            return cached
+
     limiter = get_rate_limiter()
     last_exception = None
     
     for attempt in range(max_retries):
+        response = None
         try:
             # Wait for rate limit before making request
-            wait_for_rate_limit(limiter, "github_api")
+            wait_for_rate_limit(limiter)
             
             response = session.post(
                 GITHUB_API_URL,
                 json={"query": query, "variables": variables},
             )
+            note_rate_limit_headers(limiter, response)
             
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
                 if "errors" in data:
                     # Check for rate limit errors
                     error_messages = [e.get("message", "") for e in data.get("errors", [])]
                     if any("rate limit" in msg.lower() for msg in error_messages):
                         if attempt < max_retries - 1:
-                            time.sleep(1)
+                            time.sleep(backoff_for(response, attempt))
                             continue
                     raise RuntimeError(f"GitHub GraphQL returned errors: {data['errors']}")
+                if cache is not None:
+                    cache.put(query, variables, data["data"])
                 return data["data"]
             elif response.status_code == 403 or response.status_code == 429:
                 # Rate limit or forbidden - retry with delay
                 if attempt < max_retries - 1:
-                    time.sleep(1)
+                    time.sleep(backoff_for(response, attempt))
                     continue
             elif response.status_code >= 500:
                 # Server error - retry with delay
                 if attempt < max_retries - 1:
-                    time.sleep(1)
+                    time.sleep(backoff_for(response, attempt))
                     continue
             
             last_exception = RuntimeError(f"GitHub GraphQL HTTP {response.status_code}: {response.text}")
@@ -172,38 +336,58 @@ def graphql_request(session: requests.Session, query: str, variables: Dict[str,
         except requests.exceptions.RequestException as e:
             last_exception = e
             if attempt < max_retries - 1:
-                time.sleep(1)
+                time.sleep(backoff_for(response, attempt))
                 continue
     
     # If we get here, all retries failed
     raise last_exception or RuntimeError("GraphQL request failed after all retries")
 
 
-def load_pr_threads_query() -> str:
+# <PLACEHOLDER> tokens in the .graphql templates
+_RE_QUERY_PLACEHOLDER = re.compile(r"<([A-Z_]+)>")
+
+
+@lru_cache(maxsize=None)
+def load_query(path: str) -> str:
     """
-    Load the PullRequestThreads GraphQL query from an external .graphql file
-    and replace simple <PLACEHOLDER> tokens with configured values.
+    Load a GraphQL query from an external .graphql file and replace simple
+    <PLACEHOLDER> tokens with configured values.
 
     We keep owner/name/cursor as GraphQL variables to minimize string
     interpolation while still letting you see/edit the core query separately.
+    The placeholders only depend on module constants, so the result is cached
+    per path and shared by all repo workers.
     """
-    with open(PR_THREADS_QUERY_PATH, "r", encoding="utf-8") as f:
+    with open(path, "r", encoding="utf-8") as f:
         template = f.read()
 
     replacements = {
-        "<PRS_PER_PAGE>": str(PRS_PER_PAGE),
-        "<THREADS_PER_PAGE>": str(THREADS_PER_PAGE),
-        "<COMMENTS_PER_THREAD_PAGE>": str(COMMENTS_PER_THREAD_PAGE),
+        "PRS_PER_PAGE": str(PRS_PER_PAGE),
+        "THREADS_PER_PAGE": str(THREADS_PER_PAGE),
+        "COMMENTS_PER_THREAD_PAGE": str(COMMENTS_PER_THREAD_PAGE),
     }
-    query = template
-    for placeholder, value in replacements.items():
-        query = query.replace(placeholder, value)
-    return query
+    # Single pass over the template (str.format_map is not an option, GraphQL
+    # uses braces). An unknown placeholder fails loudly instead of reaching GitHub.
+    return _RE_QUERY_PLACEHOLDER.sub(lambda m: replacements[m.group(1)], template)
+
+
+def load_pr_threads_query() -> str:
+    """Load the PullRequestThreads query that lists PRs with their first page of threads."""
+    return load_query(PR_THREADS_QUERY_PATH)
+
+
+def load_pr_review_threads_query() -> str:
+    """Load the PullRequestReviewThreads query that pages through the threads of one PR."""
+    return load_query(PR_REVIEW_THREADS_QUERY_PATH)
 
 
 def ensure_output_dir() -> None:
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(CLONES_DIR, exist_ok=True)
+    if DIFF_CACHE_PATH is not None:
+        os.makedirs(os.path.dirname(DIFF_CACHE_PATH), exist_ok=True)
+    if GRAPHQL_CACHE_PATH is not None:
+        os.makedirs(os.path.dirname(GRAPHQL_CACHE_PATH), exist_ok=True)
 
 
 def read_repos_list(path: str) -> List[str]:
@@ -221,6 +405,17 @@ def read_repos_list(path: str) -> List[str]:
     return repos
 
 
+# Linked-issue pattern, compiled once at import time. The alternatives are:
+#   - URLs containing /issues/123
+#   - owner/repo#123
+#   - bare #123, assume current repo
+_RE_LINKED_ISSUE = re.compile(
+    r"(?P<url>https://github\.com/(?P<u_owner>[A-Za-z0-9_.-]+)/(?P<u_repo>[A-Za-z0-9_.-]+)/issues/(?P<u_num>\d+))"
+    r"|(?P<r_owner>[A-Za-z0-9_.-]+)/(?P<r_repo>[A-Za-z0-9_.-]+)#(?P<r_num>\d+)"
+    r"|(?<![A-Za-z0-9_/.-])#(?P<l_num>\d+)"
+)
+
+
 def extract_linked_issues_from_text(text: str, owner: str, name: str) -> List[Dict[str, str]]:
     """
     Heuristic to extract linked issues from PR title/body text.
@@ -229,47 +424,33 @@ def extract_linked_issues_from_text(text: str, owner: str, name: str) -> List[Di
       - `#123`
       - `owner/repo#123`
       - URLs that end with `/issues/123`
+
+    All three forms are matched by a single regex in one pass over the text.
     """
-    issues: Dict[str, Dict[str, str]] = {}
+    # Every form contains a '#' or '/issues/'; most PR texts have neither
+    if not text or ("#" not in text and "/issues/" not in text):
+        return []
 
-    # owner/repo#123
-    pattern_full_ref = re.compile(r"(?P<owner>[A-Za-z0-9_.-]+)/(?P<repo>[A-Za-z0-9_.-]+)#(?P<num>\d+)")
-    for m in pattern_full_ref.finditer(text or ""):
-        num = m.group("num")
-        full_owner = m.group("owner")
-        repo = m.group("repo")
-        key = f"{full_owner}/{repo}#{num}"
-        if key not in issues:
-            issues[key] = {
-                "reference": key,
-                "url": f"https://github.com/{full_owner}/{repo}/issues/{num}",
-            }
+    issues: Dict[str, Dict[str, str]] = {}
 
-    # bare #123, assume current repo
-    pattern_local = re.compile(r"(?<![A-Za-z0-9_/.-])#(?P<num>\d+)")
-    for m in pattern_local.finditer(text or ""):
-        num = m.group("num")
-        key = f"{owner}/{name}#{num}"
-        if key not in issues:
-            issues[key] = {
-                "reference": f"#{num}",
-                "url": f"https://github.com/{owner}/{name}/issues/{num}",
-            }
+    for m in _RE_LINKED_ISSUE.finditer(text):
+        if m.group("url"):
+            num = m.group("u_num")
+            key = f"{m.group('u_owner')}/{m.group('u_repo')}#{num}"
+            entry = {"reference": key, "url": m.group("url")}
+        elif m.group("r_num"):
+            num = m.group("r_num")
+            full_owner = m.group("r_owner")
+            repo = m.group("r_repo")
+            key = f"{full_owner}/{repo}#{num}"
+            entry = {"reference": key, "url": f"https://github.com/{full_owner}/{repo}/issues/{num}"}
+        else:
+            num = m.group("l_num")
+            key = f"{owner}/{name}#{num}"
+            entry = {"reference": f"#{num}", "url": f"https://github.com/{owner}/{name}/issues/{num}"}
 
-    # URLs containing /issues/123
-    pattern_url = re.compile(
-        r"https://github\.com/(?P<owner>[A-Za-z0-9_.-]+)/(?P<repo>[A-Za-z0-9_.-]+)/issues/(?P<num>\d+)"
-    )
-    for m in pattern_url.finditer(text or ""):
-        num = m.group("num")
-        full_owner = m.group("owner")
-        repo = m.group("repo")
-        key = f"{full_owner}/{repo}#{num}"
         if key not in issues:
-            issues[key] = {
-                "reference": key,
-                "url": m.group(0),
-            }
+            issues[key] = entry
 
     return list(issues.values())
 
@@ -279,9 +460,13 @@ def fetch_pr_diffs_from_rest_api(
     owner: str,
     name: str,
     pr_number: int,
+    changed_files: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
     Fetch the full diff for a PR and per-file patches via the REST API.
+    When the PR's changed file count is known (GraphQL `changedFiles`), exactly
+    the pages holding those files are requested, without probing for an empty
+    last page.
 
     Returns a dict:
       {
@@ -297,29 +482,31 @@ def fetch_pr_diffs_from_rest_api(
     per_page = 100
     all_files: List[Dict[str, Any]] = []
     limiter = get_rate_limiter()
+    last_page = None if changed_files is None else -(-changed_files // per_page)
 
-    while True:
+    while last_page is None or page <= last_page:
         # Retry logic for REST API calls
         max_retries = 3
         resp = None
         for attempt in range(max_retries):
             try:
                 # Wait for rate limit before making request
-                wait_for_rate_limit(limiter, "github_api")
+                wait_for_rate_limit(limiter)
                 
                 resp = session.get(base_url, params={"page": page, "per_page": per_page})
+                note_rate_limit_headers(limiter, resp)
                 
                 if resp.status_code == 200:
                     break
                 elif resp.status_code == 403 or resp.status_code == 429:
                     # Rate limit - retry with delay
                     if attempt < max_retries - 1:
-                        time.sleep(1)
+                        time.sleep(backoff_for(resp, attempt))
                         continue
                 elif resp.status_code >= 500:
                     # Server error - retry with delay
                     if attempt < max_retries - 1:
-                        time.sleep(1)
+                        time.sleep(backoff_for(resp, attempt))
                         continue
                 
                 # If we get here and status is not 200, raise error
@@ -328,7 +515,7 @@ def fetch_pr_diffs_from_rest_api(
                 )
             except requests.exceptions.RequestException as e:
                 if attempt < max_retries - 1:
-                    time.sleep(1)
+                    time.sleep(backoff_for(None, attempt))
                     continue
                 raise RuntimeError(f"GitHub REST API request failed: {e}")
         
@@ -337,7 +524,7 @@ def fetch_pr_diffs_from_rest_api(
                 f"GitHub REST HTTP {resp.status_code if resp else 'unknown'} while fetching PR files"
             )
         
-        batch = resp.json()
+        batch = orjson.loads(resp.content)
         if not batch:
             break
         all_files.extend(batch)
@@ -453,11 +640,15 @@ def ensure_repo_cloned(owner: str, name: str, token: Optional[str] = None, retry
             print(f"[{owner}/{name}] Directory exists but is not a valid git repository, removing and cloning fresh...")
             shutil.rmtree(repo_path)
 
-    # Clone the repository normally (not mirror)
+    # Partial clone without checkout: only `git diff` and `git cat-file` are run
+    # on the clone, so there is no need for a working tree or for every
+    # historical blob. Commits and trees are downloaded up front; blobs are
+    # fetched on demand (git diff fetches the ones it needs in one batch), and
+    # later fetches from origin inherit the filter.
     print(f"[{owner}/{name}] Cloning repository (this may take a while for large repos)...")
     try:
         subprocess.run(
-            ["git", "clone", repo_url, repo_path],
+            ["git", "clone", "--filter=blob:none", "--no-checkout", "--no-tags", repo_url, repo_path],
             check=True,
             capture_output=True,
             env=env,
@@ -552,10 +743,124 @@ def ensure_repo_cloned(owner: str, name: str, token: Optional[str] = None, retry
     return repo_path
 
 
+# Serialises `git fetch` calls made while generating diffs
+_git_fetch_lock = threading.Lock()
+
+# Per-file sections of a `git diff` output start at a "diff --git" header line.
+# Paths with special or non-ASCII characters are C-quoted by git ("a/caf\303\251.py"),
+# so a quoted path never contains a raw newline.
+_GIT_QUOTED_PATH = r'"(?:[^"\\]|\\.)*"'
+_RE_DIFF_FILE_START = re.compile(r"^(?=diff --git )", re.MULTILINE)
+_RE_DIFF_GIT_HEADER = re.compile(
+    rf"^diff --git (?P<a>{_GIT_QUOTED_PATH}|a/.+) (?P<b>{_GIT_QUOTED_PATH}|b/.+)$", re.MULTILINE
+)
+# git terminates unquoted ---/+++ paths that contain spaces with a tab
+_RE_DIFF_NEW_PATH = re.compile(rf"^\+\+\+ (?P<path>{_GIT_QUOTED_PATH}|b/.+?)\t?$", re.MULTILINE)
+_RE_DIFF_OLD_PATH = re.compile(rf"^--- (?P<path>{_GIT_QUOTED_PATH}|a/.+?)\t?$", re.MULTILINE)
+_RE_DIFF_RENAME_TO = re.compile(rf"^(?:rename|copy) to (?P<path>{_GIT_QUOTED_PATH}|.+)$", re.MULTILINE)
+_RE_GIT_PATH_ESCAPE = re.compile(rb'\\([0-7]{3}|.)', re.DOTALL)
+_GIT_PATH_ESCAPES = {
+    b"a": b"\a", b"b": b"\b", b"t": b"\t", b"n": b"\n",
+    b"v": b"\v", b"f": b"\f", b"r": b"\r",
+}
+
+
+def unquote_git_path(path: str, prefix: str = "") -> str:
+    """
+    Undo git's C-style path quoting (escapes and octal-encoded UTF-8 bytes) and
+    strip the `a/` or `b/` prefix if given.
+    """
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        def unescape(m: "re.Match[bytes]") -> bytes:
+            esc = m.group(1)
+            if len(esc) == 3:
+                return bytes([int(esc, 8)])
+            return _GIT_PATH_ESCAPES.get(esc, esc)
+
+        raw = _RE_GIT_PATH_ESCAPE.sub(unescape, path[1:-1].encode("utf-8"))
+        path = raw.decode("utf-8", errors="replace")
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    return path
+
+
+def diff_chunk_path(chunk: str) -> Optional[str]:
+    """
+    Return the path of the file a single-file `git diff` section belongs to:
+    the post-image path, or the pre-image path for deleted files. Sections
+    without content lines (renames, mode changes, binary files) fall back to
+    the rename target or the `diff --git` header. Returns None for text that
+    is not a file section.
+    """
+    header = _RE_DIFF_GIT_HEADER.match(chunk)
+    if header is None:
+        return None
+    # Only look at the extended header, before the first hunk
+    hunk_start = chunk.find("\n@@")
+    preamble = chunk if hunk_start == -1 else chunk[:hunk_start]
+    for pattern, prefix in ((_RE_DIFF_NEW_PATH, "b/"), (_RE_DIFF_OLD_PATH, "a/"), (_RE_DIFF_RENAME_TO, "")):
+        match = pattern.search(preamble)
+        if match:
+            return unquote_git_path(match.group("path"), prefix)
+    return unquote_git_path(header.group("b"), "b/")
+
+
+class GitBatchChecker:
+    """
+    Long-lived `git cat-file --batch-check` process for one repository, so that
+    probing whether a commit exists is a pipe round trip instead of a process
+    spawn per commit. Safe to share between threads.
+    """
+
+    def __init__(self, repo_path: str):
+        self.proc = subprocess.Popen(
+            ["git", "-C", repo_path, "cat-file", "--batch-check=%(objectname) %(objecttype)"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.lock = threading.Lock()
+
+    def exists(self, sha: str) -> bool:
+        """Return True if the object exists in the repository."""
+        with self.lock:
+            if self.proc.poll() is not None:
+                raise RuntimeError("git cat-file --batch-check is not running")
+            self.proc.stdin.write(sha.encode("ascii") + b"\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        return bool(line) and not line.endswith(b" missing\n")
+
+    def close(self) -> None:
+        with self.lock:
+            if self.proc.poll() is None:
+                self.proc.stdin.close()
+                self.proc.wait()
+
+    def __enter__(self) -> "GitBatchChecker":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def commit_exists(repo_path: str, commit: str, git_checker: Optional[GitBatchChecker]) -> bool:
+    """Check whether a commit exists locally, through git_checker when available."""
+    if git_checker is not None:
+        return git_checker.exists(commit)
+    result = subprocess.run(
+        ["git", "-C", repo_path, "cat-file", "-e", commit],
+        check=False,
+        capture_output=True,
+    )
+    return result.returncode == 0
+
+
 def fetch_pr_diffs_from_git(
     repo_path: str,
     base_commit: str,
     head_commit: str,
+    git_checker: Optional[GitBatchChecker] = None,
 ) -> Dict[str, Any]:
     """
     Fetch the full diff for a PR and per-file patches using local git repository.
@@ -564,6 +869,7 @@ def fetch_pr_diffs_from_git(
         repo_path: Path to the local git repository
         base_commit: Base commit SHA (baseRefOid)
         head_commit: Head commit SHA (headRefOid)
+        git_checker: Optional batch checker used to probe commit existence
 
     Returns a dict:
       {
@@ -578,37 +884,30 @@ def fetch_pr_diffs_from_git(
 
     try:
         # First, verify commits exist locally
-        missing_commits = []
-        for commit in [base_commit, head_commit]:
-            if not commit:
-                missing_commits.append(commit)
-                continue
-            result = subprocess.run(
-                ["git", "-C", repo_path, "cat-file", "-e", commit],
-                check=False,
-                capture_output=True,
-            )
-            if result.returncode != 0:
-                missing_commits.append(commit)
-                # Commit doesn't exist, try to fetch it
-                try:
-                    subprocess.run(
-                        ["git", "-C", repo_path, "fetch", "origin", commit],
-                        check=False,
-                        capture_output=True,
-                    )
-                    # Verify it was fetched successfully
-                    verify_result = subprocess.run(
-                        ["git", "-C", repo_path, "cat-file", "-e", commit],
-                        check=False,
-                        capture_output=True,
-                    )
-                    if verify_result.returncode != 0:
-                        missing_commits.append(commit)
-                except Exception as e:
-                    # Other errors fetching commit
-                    print(f"Warning: Could not fetch commit {commit[:8]}...: {e}")
-                    missing_commits.append(commit)
+        missing_commits = [commit for commit in (base_commit, head_commit) if not commit]
+        to_fetch = [
+            commit for commit in dict.fromkeys((base_commit, head_commit))
+            if commit and not commit_exists(repo_path, commit, git_checker)
+        ]
+        if to_fetch:
+            # Fetch all missing commits in a single round trip. Diffs are prefetched
+            # from several threads; fetches into the same clone must not overlap,
+            # and another thread may have fetched the commits in the meantime.
+            try:
+                with _git_fetch_lock:
+                    to_fetch = [c for c in to_fetch if not commit_exists(repo_path, c, git_checker)]
+                    if to_fetch:
+                        subprocess.run(
+                            ["git", "-C", repo_path, "fetch", "origin", *to_fetch],
+                            check=False,
+                            capture_output=True,
+                        )
+                # Verify they were fetched successfully
+                missing_commits.extend(c for c in to_fetch if not commit_exists(repo_path, c, git_checker))
+            except Exception as e:
+                # Other errors fetching commits
+                print(f"Warning: Could not fetch commits {[c[:8] + '...' for c in to_fetch]}: {e}")
+                missing_commits.extend(to_fetch)
 
         # If we're missing commits, we can't generate a proper diff
         if missing_commits:
@@ -618,38 +917,30 @@ def fetch_pr_diffs_from_git(
                 "fileDiffs": {},
             }
 
-        # Get list of changed files
+        # Get full PR diff in a single git call; per-file diffs are split out of it.
+        # The raw patch bytes are decoded exactly once. External diff drivers and
+        # textconv filters from the user's git config are disabled: they would
+        # spawn extra processes per file and change the patch text. The a/ and b/
+        # path prefixes the per-file split relies on are forced, overriding
+        # diff.noprefix / diff.mnemonicPrefix.
         result = subprocess.run(
-            ["git", "-C", repo_path, "diff", "--name-only", f"{base_commit}..{head_commit}"],
+            [
+                "git", "-C", repo_path, "diff", "--no-color", "--no-ext-diff", "--no-textconv",
+                "--src-prefix=a/", "--dst-prefix=b/",
+                f"{base_commit}..{head_commit}",
+            ],
             check=True,
             capture_output=True,
-            text=True,
         )
-        changed_files = [f.strip() for f in result.stdout.strip().split("\n") if f.strip()]
-
-        # Get full PR diff
-        result = subprocess.run(
-            ["git", "-C", repo_path, "diff", f"{base_commit}..{head_commit}"],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
-        full_pr_diff = result.stdout
+        full_pr_diff = result.stdout.decode("utf-8", errors="replace")
 
         # Get per-file diffs
-        for filepath in changed_files:
-            try:
-                result = subprocess.run(
-                    ["git", "-C", repo_path, "diff", f"{base_commit}..{head_commit}", "--", filepath],
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                )
-                file_diffs[filepath] = result.stdout if result.stdout.strip() else None
-            except subprocess.CalledProcessError as e:
-                # Skip this file if diff fails
-                print(f"Warning: Could not generate diff for {filepath}: {e}")
-                file_diffs[filepath] = None
+        for chunk in _RE_DIFF_FILE_START.split(full_pr_diff):
+            filepath = diff_chunk_path(chunk)
+            if filepath is not None:
+                file_diffs[filepath] = chunk
+        if full_pr_diff.strip() and not file_diffs:
+            print(f"Warning: Could not split the diff for {base_commit[:8]}..{head_commit[:8]} into files, fileDiffs is empty")
     except subprocess.CalledProcessError as e:
         # If we can't generate the diff, return empty diffs
         print(f"Warning: Could not generate diff for {base_commit[:8]}..{head_commit[:8]}: {e.stderr.decode() if e.stderr else str(e)}")
@@ -671,24 +962,144 @@ def fetch_pr_diffs_from_git(
     }
 
 
+def fetch_pr_diffs(
+    session: requests.Session,
+    owner: str,
+    name: str,
+    pr: Dict[str, Any],
+    repo_path: Optional[str],
+    git_checker: Optional[GitBatchChecker] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch the diffs of a PR from the local clone (USE_GIT_FOR_DIFFS) or the
+    REST API, going through the on-disk diff cache when it is enabled.
+    """
+    base_commit = pr.get("baseRefOid")
+    head_commit = pr.get("headRefOid")
+    if USE_GIT_FOR_DIFFS:
+        source = "git"
+        compute = lambda: fetch_pr_diffs_from_git(repo_path, base_commit, head_commit, git_checker)
+    else:
+        source = "rest_api"
+        compute = lambda: fetch_pr_diffs_from_rest_api(
+            session, owner, name, pr["number"], pr.get("changedFiles")
+        )
+
+    cache = get_diff_cache()
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(source, base_commit, head_commit, compute)
+
+
+def drop_none_values(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Drop top-level keys whose value is None before serialising a record; readers
+    treat a missing key as null. Empty strings and lists are kept, since
+    consumers index fields like `commentText` directly.
+    """
+    return {key: value for key, value in record.items() if value is not None}
+
+
+def created_after_cutoff(created_at: Optional[str], cutoff_dt: Optional[datetime]) -> bool:
+    """True if the ISO 8601 timestamp is later than the (already parsed) cutoff."""
+    if cutoff_dt is None:
+        return False
+    created_dt = parse_iso8601(created_at)
+    return created_dt is not None and created_dt > cutoff_dt
+
+
+def pr_may_export_comments(pr: Dict[str, Any], cutoff_dt: Optional[datetime]) -> bool:
+    """
+    Cheap check on a PR node from the threads query: True if the PR is within
+    the creation cutoff and has (or may have, on a later thread page) a review
+    thread that collect_repo_comments would export.
+    """
+    if created_after_cutoff(pr.get("createdAt"), cutoff_dt):
+        return False
+
+    threads = pr["reviewThreads"]
+    if threads["pageInfo"]["hasNextPage"]:
+        return True
+    for thread in threads["nodes"]:
+        thread_comments = thread["comments"]["nodes"]
+        if thread.get("path") and thread_comments and str(thread_comments[0].get("diffHunk") or "").strip():
+            return True
+    return False
+
+
+class OutputWriter:
+    """
+    Background thread that serialises PR records and their comments and writes
+    them to the output files, so that encoding large diffs overlaps with the
+    network requests of the collecting thread. Files are flushed once at least
+    OUTPUT_FLUSH_INTERVAL comments were written since the last flush.
+    """
+
+    _SENTINEL = object()
+
+    def __init__(self, output_file: BinaryIO, pr_output_file: BinaryIO):
+        self.output_file = output_file
+        self.pr_output_file = pr_output_file
+        self.error: Optional[Exception] = None
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, pr_item: Dict[str, Any], comment_items: List[Dict[str, Any]]) -> None:
+        """Queue one PR record and its comments; raises if a previous write failed."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((pr_item, comment_items))
+
+    def _run(self) -> None:
+        unflushed_comments = 0
+        while (entry := self.queue.get()) is not self._SENTINEL:
+            # After a failure keep draining the queue so that put() never blocks.
+            if self.error is not None:
+                continue
+            pr_item, comment_items = entry
+            try:
+                self.pr_output_file.write(orjson.dumps(pr_item, option=orjson.OPT_APPEND_NEWLINE))
+                self.output_file.write(
+                    b"".join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in comment_items)
+                )
+                unflushed_comments += len(comment_items)
+                if unflushed_comments >= OUTPUT_FLUSH_INTERVAL:
+                    self.pr_output_file.flush()
+                    self.output_file.flush()
+                    unflushed_comments = 0
+            except Exception as e:
+                self.error = e
+
+    def close(self) -> None:
+        """Write everything still queued and stop the thread."""
+        if self.thread.is_alive():
+            self.queue.put(self._SENTINEL)
+            self.thread.join()
+
+
 def collect_repo_comments(
-    token: str, owner: str, name: str, output_file: TextIO, progress_bar: Optional[tqdm] = None
+    token: str,
+    owner: str,
+    name: str,
+    output_file: BinaryIO,
+    pr_output_file: BinaryIO,
+    progress_bar: Optional[tqdm] = None,
+    diff_executor: Optional[ThreadPoolExecutor] = None,
 ) -> Tuple[str, str, int, Optional[str]]:
     """
     Collect structured review comments that are attached to specific lines of code.
     Uses GitHub GraphQL reviewThreads to avoid fetching unrelated general comments.
-    Writes comments incrementally to output_file in JSONL format.
+    Writes comments incrementally to output_file in JSONL format. PR metadata and
+    diffs are written once per PR to pr_output_file; comments reference their PR
+    through `pullRequestNumber`.
+    When diff_executor is given, the diffs for each page of PRs are prefetched
+    concurrently on it, from the REST API or the local clone. Serialising and
+    writing happen on an OutputWriter thread.
 
     Returns: (owner, name, comment_count, error_message)
     """
-    # Create a session per worker (thread-safe)
-    session = requests.Session()
-    session.headers.update(
-        {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github+json",
-        }
-    )
+    session = get_session(token)
 
     # Ensure repository is cloned locally if using git for diffs
     repo_path: Optional[str] = None
@@ -701,198 +1112,234 @@ def collect_repo_comments(
             print(f"[{owner}/{name}] Git clone failed, skipping repository: {error_msg}")
             return (owner, name, 0, f"Failed to clone repository: {error_msg}")
 
-    comment_count = 0
+    # One long-lived `git cat-file --batch-check` per repo for commit probes
+    git_checker = GitBatchChecker(repo_path) if repo_path is not None else None
+    writer = OutputWriter(output_file, pr_output_file)
 
-    after_pr: Optional[str] = None
-    total_prs_processed = 0
+    try:
+        comment_count = 0
 
-    pr_threads_query = load_pr_threads_query()
-    pr_diff_cache: Dict[int, Dict[str, Any]] = {}
+        after_pr: Optional[str] = None
+        total_prs_processed = 0
 
-    while True:
-        if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
-            print(f"[repo {owner}/{name}] reached MAX_COMMENTS_PER_REPO={MAX_COMMENTS_PER_REPO}, stopping.")
-            break
+        pr_threads_query = load_pr_threads_query()
+        pr_review_threads_query = load_pr_review_threads_query()
+        exported_prs: set = set()
+        pr_diff_futures: Dict[int, Future] = {}
+        cutoff_dt = parse_iso8601(PR_CREATED_BEFORE_ISO)
+        # Progress bar postfix, updated in place for every written PR
+        postfix = {"comments": 0, "PRs": 0}
 
-        variables = {
-            "owner": owner,
-            "name": name,
-            "afterPR": after_pr,
-            "afterThread": None,
-            "afterComment": None,
-        }
+        while True:
+            if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
+                print(f"[repo {owner}/{name}] reached MAX_COMMENTS_PER_REPO={MAX_COMMENTS_PER_REPO}, stopping.")
+                break
 
-        data = graphql_request(session, pr_threads_query, variables)
-        repo_data = data.get("repository")
-        if not repo_data:
-            print(f"[repo {owner}/{name}] repository not found or inaccessible.")
-            break
+            variables = {
+                "owner": owner,
+                "name": name,
+                "afterPR": after_pr,
+                "afterThread": None,
+                "afterComment": None,
+            }
 
-        prs = repo_data["pullRequests"]
-        for pr in prs["nodes"]:
-            total_prs_processed += 1
-            pr_number = pr["number"]
-            base_commit = pr.get("baseRefOid")
-            head_commit = pr.get("headRefOid")
-            pr_title = pr.get("title") or ""
-            pr_body = pr.get("body") or ""
-            pr_url = pr.get("url")
-            pr_created_at = pr.get("createdAt")
-
-            # Skip PRs created after the configured cutoff.
-            cutoff_dt = parse_iso8601(PR_CREATED_BEFORE_ISO)
-            pr_created_dt = parse_iso8601(pr_created_at)
-            if cutoff_dt is not None and pr_created_dt is not None and pr_created_dt > cutoff_dt:
-                continue
+            data = graphql_request(session, pr_threads_query, variables)
+            repo_data = data.get("repository")
+            if not repo_data:
+                print(f"[repo {owner}/{name}] repository not found or inaccessible.")
+                break
 
-            linked_issues = extract_linked_issues_from_text(pr_title + "\n" + pr_body, owner, name)
+            prs = repo_data["pullRequests"]
 
-            # Fetch full PR diff and per-file diffs once per PR and reuse.
-            if pr_number not in pr_diff_cache:
-                if USE_GIT_FOR_DIFFS:
-                    if repo_path is None:
-                        # This shouldn't happen if USE_GIT_FOR_DIFFS is True, but handle it gracefully
-                        return (owner, name, comment_count, "Repository path not available for git diff")
-                    pr_diff_cache[pr_number] = fetch_pr_diffs_from_git(
-                        repo_path, base_commit, head_commit
-                    )
-                else:
-                    pr_diff_cache[pr_number] = fetch_pr_diffs_from_rest_api(
-                        session, owner, name, pr_number
-                    )
+            # Start fetching diffs for this page's PRs in the background
+            if diff_executor is not None and (repo_path is not None or not USE_GIT_FOR_DIFFS):
+                for pr in prs["nodes"]:
+                    pr_number = pr["number"]
+                    if pr_number not in exported_prs and pr_number not in pr_diff_futures and pr_may_export_comments(pr, cutoff_dt):
+                        pr_diff_futures[pr_number] = diff_executor.submit(
+                            fetch_pr_diffs, session, owner, name, pr, repo_path, git_checker
+                        )
 
-            pr_diff_info = pr_diff_cache[pr_number]
-            pr_full_diff = pr_diff_info.get("prDiff")
-            file_diffs: Dict[str, Optional[str]] = pr_diff_info.get("fileDiffs", {})
-
-            after_thread: Optional[str] = None
-            pr_thread_page = pr["reviewThreads"]
-            while True:
-                for thread in pr_thread_page["nodes"]:
-                    # Threads on specific lines have `path` and line info set.
-                    path = thread.get("path")
-                    if not path:
-                        # Skip threads not tied to a particular file line.
-                        continue
+            for pr in prs["nodes"]:
+                total_prs_processed += 1
+                pr_number = pr["number"]
+                base_commit = pr.get("baseRefOid")
+                head_commit = pr.get("headRefOid")
+                pr_title = pr.get("title") or ""
+                pr_body = pr.get("body") or ""
+                pr_url = pr.get("url")
+                pr_created_at = pr.get("createdAt")
+
+                # Skip PRs created after the configured cutoff.
+                if created_after_cutoff(pr_created_at, cutoff_dt):
+                    continue
 
-                    comments_conn = thread["comments"]
-                    thread_comments = comments_conn["nodes"]
-                    if not thread_comments:
-                        continue
+                # Output of this PR, handed to the writer once all of its threads
+                # are processed
+                pr_item: Dict[str, Any] = {}
+                pr_comments: List[Dict[str, Any]] = []
+
+                after_thread: Optional[str] = None
+                pr_thread_page = pr["reviewThreads"]
+                while True:
+                    for thread in pr_thread_page["nodes"]:
+                        # Threads on specific lines have `path` and line info set.
+                        path = thread.get("path")
+                        if not path:
+                            # Skip threads not tied to a particular file line.
+                            continue
+
+                        comments_conn = thread["comments"]
+                        thread_comments = comments_conn["nodes"]
+                        if not thread_comments:
+                            continue
 
-                    # Only count and export if there is at least one comment.
-                    first_comment = thread_comments[0]
-                    first_comment_id = first_comment.get("id")
-                    first_comment_url = first_comment.get("url")
-                    comment_text = first_comment.get("body") or ""
+                        # Only count and export if there is at least one comment.
+                        first_comment = thread_comments[0]
+                        first_comment_id = first_comment.get("id")
+                        first_comment_url = first_comment.get("url")
+                        comment_text = first_comment.get("body") or ""
 
-                    # Boolean: was there any reply (more than one comment in thread)?
-                    has_reply = len(thread_comments) > 1
+                        # Boolean: was there any reply (more than one comment in thread)?
+                        has_reply = len(thread_comments) > 1
 
-                    # GitHub UI shows "Outdated" when the underlying code has changed.
-                    # We expose this as a `resolved` flag; true means the line changed
-                    # before the PR was merged (i.e. GitHub marks it outdated).
-                    resolved = bool(first_comment.get("outdated"))
+                        # GitHub UI shows "Outdated" when the underlying code has changed.
+                        # We expose this as a `resolved` flag; true means the line changed
+                        # before the PR was merged (i.e. GitHub marks it outdated).
+                        resolved = bool(first_comment.get("outdated"))
 
-                    # Whole thread serialized as simple list of messages
-                    serialized_thread = []
-                    for c in thread_comments:
-                        serialized_thread.append(
+                        # Whole thread serialized as simple list of messages
+                        serialized_thread = [
                             {
                                 "author": (c.get("author") or {}).get("login"),
                                 "body": c.get("body"),
                                 "createdAt": c.get("createdAt"),
                                 "url": c.get("url"),
                             }
-                        )
+                            for c in thread_comments
+                        ]
+
+                        # Commit SHA for the first comment (where it was placed)
+                        commit_obj = first_comment.get("commit")
+                        comment_commit = commit_obj.get("oid") if commit_obj else None
+
+                        # diffHunk is already the specific hunk for this comment.
+                        diff_hunk = first_comment.get("diffHunk")
+                        # If GitHub doesn't provide a diff hunk (or it's empty),
+                        # skip this comment – it doesn't have a concrete code context.
+                        if not diff_hunk or not str(diff_hunk).strip():
+                            continue
 
-                    # Commit SHA for the first comment (where it was placed)
-                    commit_obj = first_comment.get("commit")
-                    comment_commit = commit_obj.get("oid") if commit_obj else None
+                        # Fetch the PR diffs lazily, once the first comment of this PR is
+                        # actually exported, and store them together with the PR metadata
+                        # in the pull requests file. PRs without exportable threads never
+                        # cost a diff fetch, and diffs are stored once per PR instead of
+                        # being copied into every comment.
+                        if pr_number not in exported_prs:
+                            if pr_number in pr_diff_futures:
+                                pr_diff_info = pr_diff_futures.pop(pr_number).result()
+                            else:
+                                if USE_GIT_FOR_DIFFS and repo_path is None:
+                                    # This shouldn't happen if USE_GIT_FOR_DIFFS is True, but handle it gracefully
+                                    return (owner, name, comment_count, "Repository path not available for git diff")
+                                pr_diff_info = fetch_pr_diffs(session, owner, name, pr, repo_path, git_checker)
+
+                            pr_item = {
+                                "pullRequestNumber": pr_number,
+                                "pullRequestUrl": pr_url,
+                                "pullRequestBaseCommit": base_commit,
+                                "pullRequestHeadCommit": head_commit,
+                                "pullRequestTitle": pr_title,
+                                "pullRequestBody": pr_body,
+                                "pullRequestCreatedAt": pr_created_at,
+                                "linkedIssues": extract_linked_issues_from_text(
+                                    pr_title + "\n" + pr_body, owner, name
+                                ),
+                                "pullRequestDiff": pr_diff_info.get("prDiff"),
+                                "fileDiffs": pr_diff_info.get("fileDiffs", {}),
+                            }
+                            pr_item = drop_none_values(pr_item)
+                            exported_prs.add(pr_number)
+
+                        item = {
+                            "commentText": comment_text,
+                            "hasReply": has_reply,
+                            "thread": serialized_thread,
+                            "filePath": path,
+                            "commentId": first_comment_id,
+                            "commentUrl": first_comment_url,
+                            "commentCommit": comment_commit,
+                            "diffHunk": diff_hunk,
+                            "resolved": resolved,
+                            "pullRequestNumber": pr_number,
+                            "pullRequestUrl": pr_url,
+                            "commentCreatedAt": first_comment.get("createdAt"),
+                        }
+                        item = drop_none_values(item)
+
+                        pr_comments.append(item)
+                        comment_count += 1
 
-                    # diffHunk is already the specific hunk for this comment.
-                    diff_hunk = first_comment.get("diffHunk")
-                    # If GitHub doesn't provide a diff hunk (or it's empty),
-                    # skip this comment – it doesn't have a concrete code context.
-                    if not diff_hunk or not str(diff_hunk).strip():
-                        continue
+                        if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
+                            break
 
-                    # Full diff for this specific file within the PR.
-                    file_full_diff = file_diffs.get(path)
-
-                    item = {
-                        "commentText": comment_text,
-                        "hasReply": has_reply,
-                        "thread": serialized_thread,
-                        "filePath": path,
-                        "commentId": first_comment_id,
-                        "commentUrl": first_comment_url,
-                        "commentCommit": comment_commit,
-                        "diffHunk": diff_hunk,
-                        "fileDiff": file_full_diff,
-                        "pullRequestDiff": pr_full_diff,
-                        "resolved": resolved,
-                        "pullRequestNumber": pr_number,
-                        "pullRequestUrl": pr_url,
-                        "pullRequestBaseCommit": base_commit,
-                        "pullRequestHeadCommit": head_commit,
-                        "pullRequestTitle": pr_title,
-                        "pullRequestBody": pr_body,
-                        "pullRequestCreatedAt": pr_created_at,
-                        "linkedIssues": linked_issues,
-                        "commentCreatedAt": first_comment.get("createdAt"),
+                    if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
+                        break
+
+                    # Pagination for comments inside threads is not deeply exploited here
+                    # because most review threads are short; for large threads we rely
+                    # on COMMENTS_PER_THREAD_PAGE.
+                    if not pr_thread_page["pageInfo"]["hasNextPage"]:
+                        break
+                    after_thread = pr_thread_page["pageInfo"]["endCursor"]
+                    # Fetch only this PR's next page of threads instead of re-running the
+                    # PR listing query for the whole page of PRs.
+                    variables = {
+                        "owner": owner,
+                        "name": name,
+                        "prNumber": pr_number,
+                        "afterThread": after_thread,
+                        "afterComment": None,
                     }
+                    data = graphql_request(session, pr_review_threads_query, variables)
+                    pr_thread_page = data["repository"]["pullRequest"]["reviewThreads"]
+
+                # A prefetched diff is left over when none of the PR's threads was
+                # exported; drop it now instead of holding it until the repo is done
+                unused_diff = pr_diff_futures.pop(pr_number, None)
+                if unused_diff is not None:
+                    unused_diff.cancel()
 
-                    # Write immediately to JSONL file (incremental writing)
+                # Write once per PR rather than per comment (incremental writing)
+                if pr_comments:
                     try:
-                        output_file.write(json.dumps(item, ensure_ascii=False) + "\n")
-                        output_file.flush()  # Ensure data is written to disk
-                        comment_count += 1
+                        writer.put(pr_item, pr_comments)
                     except Exception as e:
-                        return (owner, name, comment_count, f"Failed to write comment: {e}")
+                        return (owner, name, comment_count, f"Failed to write comments: {e}")
 
-                    # Update progress bar if provided (every 10 comments to reduce overhead)
-                    if progress_bar and comment_count % 10 == 0:
-                        progress_bar.set_postfix(
-                            {
-                                "comments": comment_count,
-                                "PRs": total_prs_processed,
-                            },
-                            refresh=False,
-                        )
-                        progress_bar.n = comment_count
-                        progress_bar.refresh()
-
-                    if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
-                        break
+                    # Advance the progress bar once per PR; tqdm itself limits
+                    # redraws to one per mininterval
+                    if progress_bar:
+                        postfix["comments"] = comment_count
+                        postfix["PRs"] = total_prs_processed
+                        progress_bar.set_postfix(postfix, refresh=False)
+                        progress_bar.update(len(pr_comments))
 
                 if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
                     break
 
-                # Pagination for comments inside threads is not deeply exploited here
-                # because most review threads are short; for large threads we rely
-                # on COMMENTS_PER_THREAD_PAGE.
-                if not pr_thread_page["pageInfo"]["hasNextPage"]:
-                    break
-                after_thread = pr_thread_page["pageInfo"]["endCursor"]
-                variables = {
-                    "owner": owner,
-                    "name": name,
-                    "afterPR": after_pr,
-                    "afterThread": after_thread,
-                    "afterComment": None,
-                }
-                data = graphql_request(session, pr_threads_query, variables)
-                pr_thread_page = data["repository"]["pullRequests"]["nodes"][0]["reviewThreads"]
-
-            if MAX_COMMENTS_PER_REPO is not None and comment_count >= MAX_COMMENTS_PER_REPO:
+            if not prs["pageInfo"]["hasNextPage"]:
                 break
+            after_pr = prs["pageInfo"]["endCursor"]
 
-        if not prs["pageInfo"]["hasNextPage"]:
-            break
-        after_pr = prs["pageInfo"]["endCursor"]
-
-    return (owner, name, comment_count, None)
+        writer.close()
+        if writer.error is not None:
+            return (owner, name, comment_count, f"Failed to write comments: {writer.error}")
+        return (owner, name, comment_count, None)
+    finally:
+        writer.close()
+        if git_checker is not None:
+            git_checker.close()
 
 
 def process_single_repo(
@@ -910,14 +1357,22 @@ def process_single_repo(
     repo_key = f"{owner}/{name}"
     progress_bar = repo_progress_bars.get(repo_key)
     
-    # Open output file for this repo (JSONL format)
+    # Open output files for this repo (JSONL format)
     output_path = os.path.join(output_dir, f"{owner}_{name}_comments.jsonl")
+    pr_output_path = os.path.join(output_dir, f"{owner}_{name}_pull_requests.jsonl")
     try:
-        with open(output_path, "w", encoding="utf-8") as output_file:
+        with open(output_path, "wb", buffering=OUTPUT_BUFFER_SIZE) as output_file, \
+                open(pr_output_path, "wb", buffering=OUTPUT_BUFFER_SIZE) as pr_output_file:
+            diff_executor = ThreadPoolExecutor(max_workers=DIFF_PREFETCH_WORKERS)
             try:
-                return collect_repo_comments(token, owner, name, output_file, progress_bar)
+                return collect_repo_comments(
+                    token, owner, name, output_file, pr_output_file, progress_bar, diff_executor
+                )
             except Exception as exc:
                 return (owner, name, 0, str(exc))
+            finally:
+                # Drop prefetches that are no longer needed (e.g. comment limit reached)
+                diff_executor.shutdown(wait=True, cancel_futures=True)
     except Exception as exc:
         return (owner, name, 0, f"Failed to open output file: {exc}")
 
@@ -969,6 +1424,8 @@ def main() -> None:
                 position=len(repo_progress_bars),
                 leave=True,
                 unit="comment",
+                mininterval=0.5,
+                smoothing=0,
                 dynamic_ncols=True,
                 bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{postfix}]",
             )
@@ -9,9 +9,19 @@ MODEL_NAME = os.getenv("MODEL")
 API_BASE = os.getenv("API_BASE")
 API_KEY = os.getenv("API_KEY")
 MAX_TOKENS = 500
+MAX_TOKENS_BOOL = 64  # Output cap for the non-CoT classifiers, which only emit the boolean field
 TEMPERATURE = 0.0
 CACHE_ENABLED = True
 
+# Provider-side prompt caching (Anthropic-style cache_control). Marks every message
+# before the test example, i.e. the instructions and few-shot demos, as a cacheable
+# prefix. OpenAI-compatible servers cache shared prefixes automatically.
+PROMPT_CACHING = False
+PROMPT_CACHE_KWARGS = (
+    {"cache_control_injection_points": [{"location": "message", "index": -2}]}
+    if PROMPT_CACHING else {}
+)
+
 # --- Paths ---
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 INITIAL_SET_PATH    = os.path.join(PROJECT_ROOT, "data", "sets", "initial_set.json")
@@ -23,4 +33,7 @@ EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 # --- Hyperparameters ---
 KNN_K = 4       # Number of examples for KNNFewShot
-RANDOM_K = 4    # Number of examples for LabeledFewShot
\ No newline at end of file
+RANDOM_K = 4    # Number of examples for LabeledFewShot
+
+# --- Evaluation ---
+NUM_THREADS = 16  # Concurrent LM calls when classifying the evaluation set
\ No newline at end of file
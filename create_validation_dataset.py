@@ -3,19 +3,22 @@
 Script to analyze comment files and create a balanced validation dataset.
 
 This script:
-1. Analyzes all JSON files in files/comments/ folder
+1. Analyzes all comment JSON / JSON Lines files in files/comments/ folder
 2. Provides an overview of resolved vs unresolved comments per repository
 3. Creates a balanced dataset with specified number of samples per repository
 4. Saves the balanced dataset to validation.csv
 """
 
-import json
+import csv
 import os
 import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-import pandas as pd
+import ijson
+import orjson
 from tqdm import tqdm
 
 # =========================
@@ -35,16 +38,28 @@ SAMPLES_PER_DATASET = 16
 # Random seed for reproducibility
 RANDOM_SEED = 42
 
+# Comment files: JSON Lines as written by comment_scraper.py (diffs live in the
+# separate *_pull_requests.jsonl files), or legacy JSON arrays with the diffs
+# embedded in every comment
+COMMENT_FILE_SUFFIXES = ("_comments.jsonl", "_comments.json")
+
+# Columns of the output CSV
+CSV_FIELDS = ["reponame", "PR_link", "comment_link", "resolved"]
+
 
 def extract_repo_name_from_filename(filename: str) -> str:
     """
     Extract repository name from filename.
     
-    Filename format: {owner}_{repo}_comments.json
+    Filename format: {owner}_{repo}_comments.json or {owner}_{repo}_comments.jsonl
     Returns: {owner}/{repo}
     """
-    # Remove .json extension and _comments suffix
-    base_name = filename.replace("_comments.json", "")
+    # Remove .json / .jsonl extension and _comments suffix
+    base_name = filename
+    for suffix in COMMENT_FILE_SUFFIXES:
+        if base_name.endswith(suffix):
+            base_name = base_name[: -len(suffix)]
+            break
     # Replace last underscore with / to get owner/repo format
     parts = base_name.rsplit("_", 1)
     if len(parts) == 2:
@@ -52,57 +67,133 @@ def extract_repo_name_from_filename(filename: str) -> str:
     return base_name
 
 
-def load_comments_from_file(file_path: Path) -> List[Dict]:
-    """Load comments from a JSON file."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Comment fields needed for the overview and the sampled dataset, keyed by
+# their ijson prefix inside the top-level array
+SAMPLED_FIELDS = {
+    "item.pullRequestUrl": "pullRequestUrl",
+    "item.commentUrl": "commentUrl",
+    "item.resolved": "resolved",
+}
+
+
+def load_comments_from_file(file_path: Path) -> Iterator[Dict]:
+    """
+    Stream comments from a JSON or JSON Lines file, keeping only the fields in
+    SAMPLED_FIELDS. In JSON arrays the multi-MB diff strings of each comment are
+    skipped by the parser instead of being materialised.
+    """
+    with open(file_path, "rb") as f:
+        if file_path.suffix == ".jsonl":
+            fields = SAMPLED_FIELDS.values()
+            for line in f:
+                if line.strip():
+                    comment = orjson.loads(line)
+                    yield {field: comment[field] for field in fields if field in comment}
+            return
+        
+        comment: Dict = {}
+        for prefix, event, value in ijson.parse(f):
+            if prefix == "item":
+                if event == "start_map":
+                    comment = {}
+                elif event == "end_map":
+                    yield comment
+            elif prefix in SAMPLED_FIELDS:
+                comment[SAMPLED_FIELDS[prefix]] = value
 
 
-def analyze_comments() -> Tuple[Dict[str, Dict], Dict[str, List[Dict]]]:
+def sample_comments(
+    comments: Iterable[Dict], k: int, rng: random.Random
+) -> Tuple[Tuple[List[Dict], List[Dict]], Dict[str, int]]:
+    """
+    Sample up to k resolved and k unresolved comments uniformly in a single pass
+    (reservoir sampling, Algorithm R), so memory stays O(k) whatever the file size.
+    Returns: ((sampled resolved, sampled unresolved), {resolved, unresolved, total} counts)
     """
-    Analyze all comment files and return statistics and organized comments.
+    resolved: List[Dict] = []
+    unresolved: List[Dict] = []
+    resolved_count = 0
+    unresolved_count = 0
+    for comment in comments:
+        if comment.get("resolved", False):
+            resolved_count += 1
+            reservoir, seen = resolved, resolved_count
+        else:
+            unresolved_count += 1
+            reservoir, seen = unresolved, unresolved_count
+        
+        if len(reservoir) < k:
+            reservoir.append(comment)
+        else:
+            j = rng.randrange(seen)
+            if j < k:
+                reservoir[j] = comment
+    
+    counts = {
+        "resolved": resolved_count,
+        "unresolved": unresolved_count,
+        "total": resolved_count + unresolved_count,
+    }
+    return (resolved, unresolved), counts
+
+
+def load_sampled_comments(
+    json_file: Path,
+) -> Tuple[str, Optional[Tuple[List[Dict], List[Dict]]], Optional[Dict[str, int]], Optional[str]]:
+    """
+    Stream one comment file and sample it (runs in a worker process). Each file
+    gets its own generator seeded from RANDOM_SEED and the file name, so the
+    result does not depend on which worker handles it.
+    Returns: (filename, (sampled resolved, sampled unresolved), counts, error_message)
+    """
+    rng = random.Random(RANDOM_SEED ^ zlib.crc32(json_file.name.encode("utf-8")))
+    try:
+        samples, counts = sample_comments(
+            load_comments_from_file(json_file), SAMPLES_PER_DATASET // 2, rng
+        )
+        return json_file.name, samples, counts, None
+    except Exception as e:
+        return json_file.name, None, None, str(e)
+
+
+def analyze_comments() -> Tuple[Dict[str, Dict], Dict[str, Tuple[List[Dict], List[Dict]]]]:
+    """
+    Analyze all comment files and return statistics and sampled comments.
     
     Returns:
         - stats: Dictionary with repo_name -> {resolved: int, unresolved: int, total: int}
-        - comments_by_repo: Dictionary with repo_name -> list of all comments
+        - samples_by_repo: Dictionary with repo_name -> (sampled resolved, sampled unresolved)
     """
     comments_dir = Path(COMMENTS_DIR)
     if not comments_dir.exists():
         raise FileNotFoundError(f"Comments directory not found: {COMMENTS_DIR}")
     
     stats: Dict[str, Dict] = {}
-    comments_by_repo: Dict[str, List[Dict]] = {}
+    samples_by_repo: Dict[str, Tuple[List[Dict], List[Dict]]] = {}
     
-    # Get all JSON files
-    json_files = list(comments_dir.glob("*_comments.json"))
+    # Get all comment files
+    json_files = [
+        path for suffix in COMMENT_FILE_SUFFIXES for path in comments_dir.glob(f"*{suffix}")
+    ]
     
     print(f"\n{'='*60}")
     print(f"Analyzing {len(json_files)} comment files...")
     print(f"{'='*60}\n")
     
-    for json_file in tqdm(json_files, desc="Loading comment files"):
-        repo_name = extract_repo_name_from_filename(json_file.name)
-        
-        try:
-            comments = load_comments_from_file(json_file)
+    # Parse files in parallel; each file is independent. Counting and sampling
+    # happen while streaming, so only the samples come back from the workers.
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(load_sampled_comments, json_files, chunksize=4)
+        for filename, samples, counts, error in tqdm(results, total=len(json_files), desc="Loading comment files"):
+            if error is not None:
+                print(f"\nError loading {filename}: {error}")
+                continue
             
-            # Count resolved vs unresolved
-            resolved_count = sum(1 for c in comments if c.get("resolved", False))
-            unresolved_count = sum(1 for c in comments if not c.get("resolved", False))
-            total_count = len(comments)
-            
-            stats[repo_name] = {
-                "resolved": resolved_count,
-                "unresolved": unresolved_count,
-                "total": total_count,
-            }
-            comments_by_repo[repo_name] = comments
-            
-        except Exception as e:
-            print(f"\nError loading {json_file.name}: {e}")
-            continue
+            repo_name = extract_repo_name_from_filename(filename)
+            stats[repo_name] = counts
+            samples_by_repo[repo_name] = samples
     
-    return stats, comments_by_repo
+    return stats, samples_by_repo
 
 
 def print_overview(stats: Dict[str, Dict]):
@@ -138,72 +229,68 @@ def print_overview(stats: Dict[str, Dict]):
 
 
 def create_balanced_dataset(
-    comments_by_repo: Dict[str, List[Dict]],
-    stats: Dict[str, Dict]
-) -> pd.DataFrame:
+    samples_by_repo: Dict[str, Tuple[List[Dict], List[Dict]]],
+    stats: Dict[str, Dict],
+    writer: csv.DictWriter,
+) -> Dict[str, int]:
     """
     Create a balanced dataset with specified number of samples per repository.
     
     Args:
-        comments_by_repo: Dictionary mapping repo names to lists of comments
+        samples_by_repo: Dictionary mapping repo names to the (resolved, unresolved)
+            comments sampled while loading
         stats: Dictionary with statistics per repository
+        writer: csv.DictWriter with columns CSV_FIELDS; rows are written to it
+            repository by repository
     
     Returns:
-        DataFrame with columns: reponame, PR_link, comment_link, resolved
+        Summary counts: {samples, repositories, resolved, unresolved}
     """
-    # Set random seed for reproducibility
-    random.seed(RANDOM_SEED)
-    
     samples_per_class = SAMPLES_PER_DATASET // 2  # Half resolved, half unresolved
     
-    balanced_data = []
+    summary = {"samples": 0, "repositories": 0, "resolved": 0, "unresolved": 0}
     
     print(f"\n{'='*60}")
     print(f"Creating balanced dataset: {SAMPLES_PER_DATASET} samples per repository")
     print(f"({samples_per_class} resolved + {samples_per_class} unresolved)")
     print(f"{'='*60}\n")
     
-    for repo_name in tqdm(sorted(comments_by_repo.keys()), desc="Sampling comments"):
-        comments = comments_by_repo[repo_name]
+    for repo_name in tqdm(sorted(samples_by_repo.keys()), desc="Sampling comments"):
+        sampled_resolved, sampled_unresolved = samples_by_repo[repo_name]
         repo_stats = stats[repo_name]
         
-        # Separate resolved and unresolved comments
-        resolved_comments = [c for c in comments if c.get("resolved", False)]
-        unresolved_comments = [c for c in comments if not c.get("resolved", False)]
+        # Check if we have enough samples (the reservoirs hold everything
+        # when a class has fewer comments than samples_per_class)
+        available_resolved = repo_stats["resolved"]
+        available_unresolved = repo_stats["unresolved"]
         
-        # Check if we have enough samples
-        available_resolved = len(resolved_comments)
-        available_unresolved = len(unresolved_comments)
-        
-        # Sample resolved comments
-        if available_resolved >= samples_per_class:
-            sampled_resolved = random.sample(resolved_comments, samples_per_class)
-        else:
+        if available_resolved < samples_per_class:
             print(f"\nWarning: {repo_name} has only {available_resolved} resolved comments, "
                   f"using all {available_resolved} instead of {samples_per_class}")
-            sampled_resolved = resolved_comments
         
-        # Sample unresolved comments
-        if available_unresolved >= samples_per_class:
-            sampled_unresolved = random.sample(unresolved_comments, samples_per_class)
-        else:
+        if available_unresolved < samples_per_class:
             print(f"\nWarning: {repo_name} has only {available_unresolved} unresolved comments, "
                   f"using all {available_unresolved} instead of {samples_per_class}")
-            sampled_unresolved = unresolved_comments
         
         # Add to balanced dataset
-        for comment in sampled_resolved + sampled_unresolved:
-            balanced_data.append({
+        sampled = sampled_resolved + sampled_unresolved
+        writer.writerows(
+            {
                 "reponame": repo_name,
                 "PR_link": comment.get("pullRequestUrl", ""),
                 "comment_link": comment.get("commentUrl", ""),
-                "resolved": comment.get("resolved", False)
-            })
-    
-    # Create DataFrame
-    df = pd.DataFrame(balanced_data)
+                "resolved": comment.get("resolved", False),
+            }
+            for comment in sampled
+        )
+        
+        if sampled:
+            summary["samples"] += len(sampled)
+            summary["repositories"] += 1
+            summary["resolved"] += len(sampled_resolved)
+            summary["unresolved"] += len(sampled_unresolved)
     
-    return df
+    return summary
 
 
 def main():
@@ -213,24 +300,24 @@ def main():
     print(f"{'='*60}")
     
     # Analyze comments
-    stats, comments_by_repo = analyze_comments()
+    stats, samples_by_repo = analyze_comments()
     
     # Print overview
     print_overview(stats)
     
-    # Create balanced dataset
-    balanced_df = create_balanced_dataset(comments_by_repo, stats)
-    
-    # Save to CSV
+    # Create balanced dataset, streaming rows straight into the CSV
     output_path = Path(OUTPUT_CSV)
-    balanced_df.to_csv(output_path, index=False)
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        summary = create_balanced_dataset(samples_by_repo, stats, writer)
     
     print(f"\n{'='*60}")
     print(f"Balanced dataset saved to: {output_path}")
-    print(f"Total samples: {len(balanced_df)}")
-    print(f"Repositories: {balanced_df['reponame'].nunique()}")
-    print(f"Resolved: {balanced_df['resolved'].sum()}")
-    print(f"Unresolved: {(~balanced_df['resolved']).sum()}")
+    print(f"Total samples: {summary['samples']}")
+    print(f"Repositories: {summary['repositories']}")
+    print(f"Resolved: {summary['resolved']}")
+    print(f"Unresolved: {summary['unresolved']}")
     print(f"{'='*60}\n")
 
 
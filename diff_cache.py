@@ -0,0 +1,93 @@
+"""
+Persistent on-disk cache for pull request diffs.
+
+A PR diff is fully determined by its (base commit, head commit) pair, and commit
+SHAs are immutable, so diffs computed once can be reused across runs (e.g. after
+a crash, or when topping up MAX_COMMENTS_PER_REPO) and across repository lists.
+Entries are stored in a SQLite database as zlib-compressed JSON blobs of
+{"prDiff": ..., "fileDiffs": {...}}, keyed by the diff source ("git" or
+"rest_api", whose patch formats differ) and the two commit SHAs.
+"""
+
+import sqlite3
+import threading
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+import orjson
+
+
+class DiffCache:
+    """
+    SQLite-backed diff cache shared by all threads of a process.
+    A single connection is used, serialised with a lock.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS diffs (
+                    source TEXT NOT NULL,
+                    base_sha TEXT NOT NULL,
+                    head_sha TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    PRIMARY KEY (source, base_sha, head_sha)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def get(self, source: str, base_sha: str, head_sha: str) -> Optional[Dict[str, Any]]:
+        """Return the cached diff for the key, or None if it is not cached."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM diffs WHERE source = ? AND base_sha = ? AND head_sha = ?",
+                (source, base_sha, head_sha),
+            ).fetchone()
+        if row is None:
+            return None
+        return orjson.loads(zlib.decompress(row[0]))
+
+    def put(self, source: str, base_sha: str, head_sha: str, diff: Dict[str, Any]) -> None:
+        """Store a diff under the key, replacing any previous entry."""
+        payload = zlib.compress(orjson.dumps(diff))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO diffs (source, base_sha, head_sha, payload) VALUES (?, ?, ?, ?)",
+                (source, base_sha, head_sha, payload),
+            )
+            self._conn.commit()
+
+    def get_or_compute(
+        self,
+        source: str,
+        base_sha: Optional[str],
+        head_sha: Optional[str],
+        compute: Callable[[], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Return the cached diff for the key, computing and storing it on a miss.
+        Empty diffs are not stored, since the fetchers also return them on errors
+        (missing commits, failed requests) that may succeed on a later run.
+        PRs without both commit SHAs are never cached.
+        """
+        if not base_sha or not head_sha:
+            return compute()
+
+        cached = self.get(source, base_sha, head_sha)
+        if cached is not None:
+            return cached
+
+        diff = compute()
+        if diff.get("prDiff") or diff.get("fileDiffs"):
+            self.put(source, base_sha, head_sha, diff)
+        return diff
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,12 +1,19 @@
 import os
+import calendar
 import csv
+import threading
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, TextIO, Tuple
 from dotenv import load_dotenv
 
+from github_backoff import backoff_for
+from graphql_cache import GraphQLCache
+
 # =========================
 # Configuration
 # =========================
@@ -17,21 +24,36 @@ GITHUB_API_URL = "https://api.github.com/graphql"
 # GraphQL query file path
 SEARCH_QUERY_PATH = "/home/vahid/Desktop/CommentCheck/queries/query_search_repositories.graphql"
 
+# GraphQL fragment with the per-repository details (languages, latest issue),
+# fetched only for repositories that pass the PR and issue count filters
+REPOSITORY_DETAILS_FRAGMENT_PATH = "/home/vahid/Desktop/CommentCheck/queries/fragment_repository_details.graphql"
+
 # Output CSV file base path (timestamp will be added automatically)
 OUTPUT_CSV_BASE_PATH = "/home/vahid/Desktop/CommentCheck/files/repos/repos"
 
 # Search parameters
 PYTHON_PERCENTAGE_THRESHOLD = 95.0  # Minimum Python percentage (95%)
 REPOSITORY_THRESHOLD = 20  # Stop after finding this many repositories
-REPOSITORIES_PER_PAGE = 50  # Number of repos per GraphQL query page (reduced to avoid resource limits)
+REPOSITORIES_PER_PAGE = 50  # Initial number of repos per GraphQL query page (adapted during the search)
+MIN_REPOSITORIES_PER_PAGE = 5  # Lower bound for the adaptive page size
+MAX_REPOSITORIES_PER_PAGE = 100  # Upper bound for the adaptive page size (GitHub's maximum)
+PAGE_SIZE_STEP = 5  # Page size increase after PAGE_SIZE_GROWTH_STREAK clean pages
+PAGE_SIZE_GROWTH_STREAK = 3  # Consecutive pages without resource limit errors before growing
+DETAILS_BATCH_SIZE = 25  # Repositories per batched details query (halved on resource limit errors)
 MIN_STARS = 1000  # Minimum stars to consider (adjust as needed)
 MIN_ISSUES = 5000  # Minimum number of issues required
 MIN_PRS = 5000  # Minimum number of PRs required
 ISSUE_ACTIVITY_MONTHS = 24  # Consider issues "active" if updated within this many months
+PUSHED_WITHIN_MONTHS: Optional[int] = 24  # Only search repositories pushed to within this many months (None to disable)
+
+# SQLite file caching GraphQL responses across runs (shared with comment_scraper.py;
+# entries are keyed by query and variables). Set to None to disable the cache.
+GRAPHQL_CACHE_PATH: Optional[str] = "/home/vahid/Desktop/CommentCheck/files/graphql_cache.sqlite3"
+SEARCH_CACHE_TTL = 6 * 60 * 60  # seconds a cached search page is reused
+DETAILS_CACHE_TTL = 24 * 60 * 60  # seconds cached repository details are reused
 
 # Retry configuration
 MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
 
 # Debug logging
 ENABLE_DEBUG_LOGS = False  # Set to False to reduce log verbosity
@@ -48,16 +70,16 @@ def load_github_token() -> str:
     return token
 
 
-def load_search_query() -> str:
+def load_query_file(path: str) -> str:
     """
-    Load the GraphQL query from the external file.
+    Load a GraphQL query (or fragment) from an external file.
     """
     if ENABLE_DEBUG_LOGS:
-        print(f"[DEBUG] Loading GraphQL query from: {SEARCH_QUERY_PATH}")
-    if not os.path.exists(SEARCH_QUERY_PATH):
-        raise FileNotFoundError(f"GraphQL query file not found: {SEARCH_QUERY_PATH}")
+        print(f"[DEBUG] Loading GraphQL query from: {path}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"GraphQL query file not found: {path}")
     
-    with open(SEARCH_QUERY_PATH, "r", encoding="utf-8") as f:
+    with open(path, "r", encoding="utf-8") as f:
         query = f.read()
     
     if ENABLE_DEBUG_LOGS:
@@ -65,104 +87,250 @@ def load_search_query() -> str:
     return query
 
 
+def load_search_query() -> str:
+    """
+    Load the repository search query.
+    """
+    return load_query_file(SEARCH_QUERY_PATH)
+
+
+def load_repository_details_fragment() -> str:
+    """
+    Load the `RepositoryDetails` fragment used by the batched details query.
+    """
+    return load_query_file(REPOSITORY_DETAILS_FRAGMENT_PATH)
+
+
+# Global GraphQL response cache (shared with the prefetch thread)
+_graphql_cache_lock = threading.Lock()
+_graphql_cache: Optional[GraphQLCache] = None
+
+
+def get_graphql_cache() -> Optional[GraphQLCache]:
+    """
+    Get or create the on-disk GraphQL response cache, or None if
+    GRAPHQL_CACHE_PATH is unset.
+    """
+    global _graphql_cache
+    if GRAPHQL_CACHE_PATH is None:
+        return None
+    if _graphql_cache is None:
+        with _graphql_cache_lock:
+            if _graphql_cache is None:
+                os.makedirs(os.path.dirname(GRAPHQL_CACHE_PATH), exist_ok=True)
+                _graphql_cache = GraphQLCache(GRAPHQL_CACHE_PATH, DETAILS_CACHE_TTL)
+    return _graphql_cache
+
+
 def graphql_request(
     session: requests.Session,
     query: str,
     variables: Dict[str, Any],
-    retry_count: int = 0
+    cache_ttl: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
-    Send a GraphQL request with retry logic.
+    Send a GraphQL request, retrying up to MAX_RETRIES times after the delay
+    given by backoff_for.
+    With cache_ttl set (and the cache enabled), a cached response younger than
+    cache_ttl seconds is returned instead, and complete responses are cached;
+    partial ones (resource limit errors) are not, so their nulls get retried.
     """
-    try:
-        if ENABLE_DEBUG_LOGS:
-            print(f"\n[DEBUG] Sending GraphQL request (attempt {retry_count + 1})...")
-            print(f"[DEBUG] Variables: {json.dumps(variables, indent=2)}")
-        
-        response = session.post(
-            GITHUB_API_URL,
-            json={"query": query, "variables": variables},
-        )
-        
-        if ENABLE_DEBUG_LOGS:
-            print(f"[DEBUG] Response status code: {response.status_code}")
-        
-        if response.status_code != 200:
+    cache = get_graphql_cache() if cache_ttl is not None else None
+    if cache is not None:
+        cached = cache.get(query, variables, cache_ttl)
+        if cached is not None:
             if ENABLE_DEBUG_LOGS:
-                print(f"[DEBUG] Error response body: {response.text}")
-            if retry_count < MAX_RETRIES:
-                print(f"  HTTP {response.status_code}, retrying ({retry_count + 1}/{MAX_RETRIES})...")
-                time.sleep(RETRY_DELAY)
-                return graphql_request(session, query, variables, retry_count + 1)
-            raise RuntimeError(f"GitHub GraphQL HTTP {response.status_code}: {response.text}")
-
-        data = response.json()
-        if ENABLE_DEBUG_LOGS:
-            print(f"[DEBUG] Response data keys: {list(data.keys())}")
-        
-        if "errors" in data:
+                print(f"[DEBUG] Serving GraphQL response from cache")
+            return cached
+    
+    for attempt in range(MAX_RETRIES + 1):
+        can_retry = attempt < MAX_RETRIES
+        response = None
+        try:
+            if ENABLE_DEBUG_LOGS:
+                print(f"\n[DEBUG] Sending GraphQL request (attempt {attempt + 1})...")
+                print(f"[DEBUG] Variables: {json.dumps(variables, indent=2)}")
+            
+            response = session.post(
+                GITHUB_API_URL,
+                data=orjson.dumps({"query": query, "variables": variables}),
+                headers={"Content-Type": "application/json"},
+            )
+            
             if ENABLE_DEBUG_LOGS:
-                print(f"[DEBUG] GraphQL errors found:")
-            # Check if errors are critical (non-resource-limit errors)
-            critical_errors = []
-            resource_limit_errors = []
+                print(f"[DEBUG] Response status code: {response.status_code}")
             
-            for error in data["errors"]:
-                error_type = error.get("type", "")
-                error_msg = error.get("message", "")
+            if response.status_code != 200:
                 if ENABLE_DEBUG_LOGS:
-                    print(f"  - {json.dumps(error, indent=2)}")
-                
-                if error_type == "RESOURCE_LIMITS_EXCEEDED":
-                    resource_limit_errors.append(error)
-                else:
-                    critical_errors.append(error)
+                    print(f"[DEBUG] Error response body: {response.text}")
+                if can_retry:
+                    delay = backoff_for(response, attempt)
+                    print(f"  HTTP {response.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})...")
+                    time.sleep(delay)
+                    continue
+                raise RuntimeError(f"GitHub GraphQL HTTP {response.status_code}: {response.text}")
+
+            data = orjson.loads(response.content)
+            if ENABLE_DEBUG_LOGS:
+                print(f"[DEBUG] Response data keys: {list(data.keys())}")
             
-            # If we have critical errors, fail
-            if critical_errors:
-                if retry_count < MAX_RETRIES:
-                    print(f"  Critical GraphQL errors, retrying ({retry_count + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    return graphql_request(session, query, variables, retry_count + 1)
+            if "errors" in data:
+                if ENABLE_DEBUG_LOGS:
+                    print(f"[DEBUG] GraphQL errors found:")
+                # Check if errors are critical (non-resource-limit errors)
+                critical_errors = []
+                resource_limit_errors = []
                 
-                error_messages = []
-                for error in critical_errors:
-                    msg = error.get("message", "Unknown error")
-                    locations = error.get("locations", [])
-                    path = error.get("path", [])
-                    error_messages.append(f"Message: {msg}, Locations: {locations}, Path: {path}")
+                for error in data["errors"]:
+                    error_type = error.get("type", "")
+                    error_msg = error.get("message", "")
+                    if ENABLE_DEBUG_LOGS:
+                        print(f"  - {json.dumps(error, indent=2)}")
+                    
+                    if error_type == "RESOURCE_LIMITS_EXCEEDED":
+                        resource_limit_errors.append(error)
+                    else:
+                        critical_errors.append(error)
                 
-                raise RuntimeError(f"GitHub GraphQL returned critical errors:\n" + "\n".join(error_messages))
+                # If we have critical errors, fail
+                if critical_errors:
+                    if can_retry:
+                        delay = backoff_for(response, attempt)
+                        print(f"  Critical GraphQL errors, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})...")
+                        time.sleep(delay)
+                        continue
+                    
+                    error_messages = []
+                    for error in critical_errors:
+                        msg = error.get("message", "Unknown error")
+                        locations = error.get("locations", [])
+                        path = error.get("path", [])
+                        error_messages.append(f"Message: {msg}, Locations: {locations}, Path: {path}")
+                    
+                    raise RuntimeError(f"GitHub GraphQL returned critical errors:\n" + "\n".join(error_messages))
+                
+                # If only resource limit errors, we can still process the data that was returned
+                # (some nodes may have failed, but others may have succeeded)
+                if resource_limit_errors:
+                    print(f"[WARNING] Resource limit errors occurred for some repositories, but continuing with available data...")
+                    if ENABLE_DEBUG_LOGS:
+                        print(f"  Affected paths: {[err.get('path', []) for err in resource_limit_errors]}")
             
-            # If only resource limit errors, we can still process the data that was returned
-            # (some nodes may have failed, but others may have succeeded)
-            if resource_limit_errors:
-                print(f"[WARNING] Resource limit errors occurred for some repositories, but continuing with available data...")
+            if "data" not in data:
                 if ENABLE_DEBUG_LOGS:
-                    print(f"  Affected paths: {[err.get('path', []) for err in resource_limit_errors]}")
+                    print(f"[DEBUG] No 'data' key in response. Full response: {json.dumps(data, indent=2)}")
+                raise RuntimeError(f"Unexpected response format: {json.dumps(data, indent=2)}")
+                
+            if ENABLE_DEBUG_LOGS:
+                print(f"[DEBUG] Request successful")
+            if cache is not None and "errors" not in data:
+                cache.put(query, variables, data["data"])
+            return data["data"]
         
-        if "data" not in data:
+        except requests.RequestException as e:
             if ENABLE_DEBUG_LOGS:
-                print(f"[DEBUG] No 'data' key in response. Full response: {json.dumps(data, indent=2)}")
-            raise RuntimeError(f"Unexpected response format: {json.dumps(data, indent=2)}")
-            
-        if ENABLE_DEBUG_LOGS:
-            print(f"[DEBUG] Request successful")
-        return data["data"]
+                print(f"[DEBUG] Request exception type: {type(e).__name__}: {str(e)}")
+            if can_retry:
+                delay = backoff_for(response, attempt)
+                print(f"  Request exception: {e}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})...")
+                time.sleep(delay)
+                continue
+            raise
+        except orjson.JSONDecodeError as e:
+            if ENABLE_DEBUG_LOGS:
+                print(f"[DEBUG] JSON decode error: {e}")
+                print(f"[DEBUG] Response text: {response.text if response is not None else 'N/A'}")
+            raise RuntimeError(f"Failed to parse JSON response: {e}")
     
-    except requests.RequestException as e:
-        if ENABLE_DEBUG_LOGS:
-            print(f"[DEBUG] Request exception type: {type(e).__name__}: {str(e)}")
-        if retry_count < MAX_RETRIES:
-            print(f"  Request exception: {e}, retrying ({retry_count + 1}/{MAX_RETRIES})...")
-            time.sleep(RETRY_DELAY)
-            return graphql_request(session, query, variables, retry_count + 1)
-        raise
-    except json.JSONDecodeError as e:
-        if ENABLE_DEBUG_LOGS:
-            print(f"[DEBUG] JSON decode error: {e}")
-            print(f"[DEBUG] Response text: {response.text if 'response' in locals() else 'N/A'}")
-        raise RuntimeError(f"Failed to parse JSON response: {e}")
+    raise RuntimeError("GraphQL request failed after all retries")
+
+
+def fetch_search_page(
+    session: requests.Session,
+    query_template: str,
+    search_query_string: str,
+    after_cursor: Optional[str],
+    page_size: int,
+) -> Dict[str, Any]:
+    """
+    Fetch one page of repository search results.
+    """
+    variables = {
+        "query": search_query_string,
+        "first": page_size,
+        "after": after_cursor
+    }
+    return graphql_request(session, query_template, variables, cache_ttl=SEARCH_CACHE_TTL)
+
+
+def build_batched_details_query(
+    names_with_owner: List[str], details_fragment: str
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build one query fetching the `RepositoryDetails` fragment for several
+    repositories, each under its own alias (`r0`, `r1`, ...).
+    Returns: (query, variables)
+    """
+    parameters = []
+    fields = []
+    variables: Dict[str, Any] = {}
+    for i, name_with_owner in enumerate(names_with_owner):
+        owner, name = name_with_owner.split("/", 1)
+        parameters.append(f"$o{i}: String!, $n{i}: String!")
+        fields.append(f"  r{i}: repository(owner: $o{i}, name: $n{i}) {{ ...RepositoryDetails }}")
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = name
+    
+    query = (
+        f"query RepositoryDetails({', '.join(parameters)}) {{\n"
+        + "\n".join(fields)
+        + "\n}\n\n"
+        + details_fragment
+    )
+    return query, variables
+
+
+def fetch_repository_details(
+    session: requests.Session,
+    details_fragment: str,
+    names_with_owner: List[str],
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Fetch the details of the given repositories with batched queries of up to
+    DETAILS_BATCH_SIZE aliases. Repositories whose details come back null (e.g.
+    RESOURCE_LIMITS_EXCEEDED) are retried in batches of half the size, down to
+    single repositories; only those still failing alone map to None.
+    """
+    details: Dict[str, Optional[Dict[str, Any]]] = {}
+    pending = [
+        names_with_owner[i:i + DETAILS_BATCH_SIZE]
+        for i in range(0, len(names_with_owner), DETAILS_BATCH_SIZE)
+    ]
+    
+    while pending:
+        batch = pending.pop(0)
+        query, variables = build_batched_details_query(batch, details_fragment)
+        data = graphql_request(session, query, variables, cache_ttl=DETAILS_CACHE_TTL)
+        
+        failed = []
+        for i, name_with_owner in enumerate(batch):
+            repo_details = data.get(f"r{i}")
+            if repo_details is None:
+                failed.append(name_with_owner)
+            else:
+                details[name_with_owner] = repo_details
+        
+        if not failed:
+            continue
+        if len(batch) == 1:
+            details[batch[0]] = None
+            continue
+        
+        # Retry the failed repositories in smaller batches, before the rest
+        half = max(1, len(batch) // 2)
+        pending[:0] = [failed[i:i + half] for i in range(0, len(failed), half)]
+    
+    return details
 
 
 def calculate_python_percentage(languages_data: Dict[str, Any]) -> Optional[float]:
@@ -181,28 +349,63 @@ def calculate_python_percentage(languages_data: Dict[str, Any]) -> Optional[floa
     if total_size == 0:
         return None
     
-    # Find Python language size
-    python_size = 0
-    for edge in edges:
-        lang_name = edge.get("node", {}).get("name", "")
-        if lang_name.lower() == "python":
-            python_size = edge.get("size", 0)
-            break
-    
-    if python_size == 0:
-        return 0.0
+    # Linguist language names are canonical, so "Python" matches exactly
+    python_size = next(
+        (edge["size"] for edge in edges if edge["node"]["name"] == "Python"), 0
+    )
+    return python_size * 100.0 / total_size
+
+
+def build_search_query_string() -> str:
+    """
+    Build the repository search string. Everything GitHub's search qualifiers
+    can express (stars, last push, archived) is filtered server-side; issue and
+    PR counts have no qualifier and are checked on the results.
+    """
+    qualifiers = ["language:python", f"stars:>={MIN_STARS}", "archived:false"]
+    if PUSHED_WITHIN_MONTHS is not None:
+        pushed_cutoff = datetime.now(timezone.utc) - timedelta(days=PUSHED_WITHIN_MONTHS * 30)
+        qualifiers.append(f"pushed:>={pushed_cutoff:%Y-%m-%d}")
+    qualifiers.append("sort:stars-desc")
+    return " ".join(qualifiers)
+
+
+def next_page_size(page_size: int, hit_resource_limits: bool, clean_streak: int) -> Tuple[int, int]:
+    """
+    Additive-increase / multiplicative-decrease page size control.
+    Halves the page size on resource limit errors, and grows it by
+    PAGE_SIZE_STEP after PAGE_SIZE_GROWTH_STREAK consecutive clean pages,
+    within [MIN_REPOSITORIES_PER_PAGE, MAX_REPOSITORIES_PER_PAGE].
+    Returns the new page size and clean page streak.
+    """
+    if hit_resource_limits:
+        return max(MIN_REPOSITORIES_PER_PAGE, page_size // 2), 0
     
-    percentage = (python_size / total_size) * 100.0
-    return percentage
+    clean_streak += 1
+    if clean_streak >= PAGE_SIZE_GROWTH_STREAK:
+        return min(MAX_REPOSITORIES_PER_PAGE, page_size + PAGE_SIZE_STEP), 0
+    return page_size, clean_streak
 
 
-def is_actively_using_issues(issues_data: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+def issue_activity_cutoff_epoch() -> float:
+    """
+    UTC epoch seconds before which an issue update no longer counts as recent
+    (ISSUE_ACTIVITY_MONTHS months, approximated as 30 days each, before now).
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ISSUE_ACTIVITY_MONTHS * 30)
+    return cutoff.timestamp()
+
+
+def is_actively_using_issues(
+    issues_data: Dict[str, Any], cutoff_epoch: float
+) -> Tuple[bool, Optional[str]]:
     """
     Determine if repository is actively using issues based on recent activity.
     Returns (is_active, last_updated_date).
     A repository is considered active if:
     - Has at least one issue
-    - The most recently updated issue was updated within ISSUE_ACTIVITY_MONTHS months
+    - The most recently updated issue was updated at or after cutoff_epoch
+      (see issue_activity_cutoff_epoch)
     """
     if not issues_data:
         return False, None
@@ -223,14 +426,14 @@ def is_actively_using_issues(issues_data: Dict[str, Any]) -> Tuple[bool, Optiona
     if not updated_at_str:
         return True, None
     
-    # Parse the ISO 8601 datetime
+    # GitHub returns UTC timestamps ("2024-05-01T12:34:56Z"), so the first 19
+    # characters convert straight to epoch seconds
     try:
-        updated_at = datetime.fromisoformat(updated_at_str.replace("Z", "+00:00"))
-        cutoff_date = datetime.now(updated_at.tzinfo) - timedelta(days=ISSUE_ACTIVITY_MONTHS * 30)
+        updated_epoch = calendar.timegm(time.strptime(updated_at_str[:19], "%Y-%m-%dT%H:%M:%S"))
         
-        is_active = updated_at >= cutoff_date
+        is_active = updated_epoch >= cutoff_epoch
         return is_active, updated_at_str
-    except (ValueError, AttributeError):
+    except (ValueError, TypeError):
         # If parsing fails, assume active since they have issues
         return True, updated_at_str
 
@@ -244,57 +447,66 @@ def generate_csv_path() -> str:
     return csv_path
 
 
-def ensure_csv_file_exists(csv_path: str):
+def open_csv_file(csv_path: str) -> Tuple[TextIO, Any]:
     """
-    Initialize the CSV file with headers. Always creates a new file.
+    Create the CSV file and write its headers. Always creates a new file.
+    Returns the open file and a csv.writer on it; the caller closes the file.
     """
     os.makedirs(os.path.dirname(csv_path), exist_ok=True)
     
     # Always create a new file with headers
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "Repository",
-            "Stars",
-            "Python_Percentage",
-            "PR_Count",
-            "Issue_Count",
-            "Issues_Active",
-            "Last_Issue_Updated"
-        ])
-
-
-def write_repo_to_csv(csv_path: str, repo_info: Dict[str, Any]):
-    """
-    Append a single repository to the CSV file.
-    """
-    with open(csv_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            repo_info["nameWithOwner"],
-            repo_info["stars"],
-            f"{repo_info['python_percentage']:.2f}",
-            repo_info["pr_count"],
-            repo_info["issue_count"],
-            "Yes" if repo_info["issues_active"] else "No",
-            repo_info["last_issue_updated"] or ""
-        ])
-
-
-def search_python_repositories(session: requests.Session, query_template: str) -> None:
+    f = open(csv_path, "w", newline="", encoding="utf-8")
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow([
+        "Repository",
+        "Stars",
+        "Python_Percentage",
+        "PR_Count",
+        "Issue_Count",
+        "Issues_Active",
+        "Last_Issue_Updated"
+    ])
+    return f, writer
+
+
+def repo_csv_row(repo_info: Dict[str, Any]) -> List[Any]:
+    """
+    Build the CSV row of a single repository.
+    """
+    return [
+        repo_info["nameWithOwner"],
+        repo_info["stars"],
+        f"{repo_info['python_percentage']:.2f}",
+        repo_info["pr_count"],
+        repo_info["issue_count"],
+        "Yes" if repo_info["issues_active"] else "No",
+        repo_info["last_issue_updated"] or ""
+    ]
+
+
+def search_python_repositories(
+    session: requests.Session, query_template: str, details_fragment: str
+) -> None:
     """
     Search for repositories that are at least 95% Python, sorted by popularity.
+    The search returns only cheap counts; languages and issue activity are
+    fetched afterwards for the repositories that pass the count filters.
     """
     # Generate timestamped CSV file path
     csv_path = generate_csv_path()
-    ensure_csv_file_exists(csv_path)
+    csv_file, csv_writer = open_csv_file(csv_path)
     
     filtered_count = 0
     pages_traversed = 0
     after_cursor: Optional[str] = None
     
+    # Issue activity is judged against a single cutoff for the whole search
+    activity_cutoff_epoch = issue_activity_cutoff_epoch()
+    
     # Search query: repositories with Python language, sorted by stars
-    search_query_string = f"language:python stars:>={MIN_STARS} sort:stars-desc"
+    search_query_string = build_search_query_string()
+    page_size = REPOSITORIES_PER_PAGE
+    clean_streak = 0
     
     print(f"Starting search for Python repositories (>= {PYTHON_PERCENTAGE_THRESHOLD}% Python)...")
     print(f"Search query: {search_query_string}")
@@ -303,117 +515,158 @@ def search_python_repositories(session: requests.Session, query_template: str) -
     print(f"Output CSV: {csv_path}")
     print("-" * 60)
     
-    while filtered_count < REPOSITORY_THRESHOLD:
-        pages_traversed += 1
-        
-        variables = {
-            "query": search_query_string,
-            "first": REPOSITORIES_PER_PAGE,
-            "after": after_cursor
-        }
-        
-        print(f"\n[Page {pages_traversed}] Fetching {REPOSITORIES_PER_PAGE} repositories...")
-        
-        try:
-            data = graphql_request(session, query_template, variables)
-        except Exception as e:
-            print(f"  Error fetching page {pages_traversed}: {e}")
-            break
-        
-        search_results = data.get("search", {})
-        repositories = search_results.get("nodes", [])
-        page_info = search_results.get("pageInfo", {})
-        has_next_page = page_info.get("hasNextPage", False)
-        after_cursor = page_info.get("endCursor")
-        
-        if not repositories:
-            print("  No more repositories found.")
-            break
-        
-        print(f"  Processing {len(repositories)} repositories from this page...")
-        
-        for repo in repositories:
-            if filtered_count >= REPOSITORY_THRESHOLD:
-                break
+    # Search pages are fetched one ahead on a background thread, so the next
+    # page is already in flight while this page's details are fetched
+    executor = ThreadPoolExecutor(max_workers=1)
+    next_page = executor.submit(
+        fetch_search_page, session, query_template, search_query_string, None, page_size
+    )
+    try:
+        while filtered_count < REPOSITORY_THRESHOLD:
+            pages_traversed += 1
             
-            # Skip if repository data is None (may happen due to resource limit errors)
-            if repo is None:
-                print(f"    ⚠ Skipping repository with null data (may be due to resource limits)")
-                continue
+            print(f"\n[Page {pages_traversed}] Fetching repositories...")
             
-            name_with_owner = repo.get("nameWithOwner", "")
-            if not name_with_owner:
-                print(f"    ⚠ Skipping repository with missing nameWithOwner")
-                continue
+            try:
+                data = next_page.result()
+            except Exception as e:
+                print(f"  Error fetching page {pages_traversed}: {e}")
+                break
             
-            stars = repo.get("stargazerCount", 0)
-            languages = repo.get("languages", {})
-            pr_count = repo.get("pullRequests", {}).get("totalCount", 0)
-            issues_data = repo.get("issues")
+            search_results = data.get("search", {})
+            repositories = search_results.get("nodes", [])
+            page_info = search_results.get("pageInfo", {})
+            has_next_page = page_info.get("hasNextPage", False)
+            after_cursor = page_info.get("endCursor")
             
-            # Handle case where issues data might be None due to resource limits
-            if issues_data is None:
-                print(f"    ⚠ {name_with_owner}: Issues data unavailable (resource limit)")
-                continue
+            if not repositories:
+                print("  No more repositories found.")
+                break
             
-            issue_count = issues_data.get("totalCount", 0)
+            # Null nodes mean the page ran into resource limits. The next page
+            # is already in flight, so the new size applies from the one after
+            previous_page_size = page_size
+            page_size, clean_streak = next_page_size(
+                page_size, any(repo is None for repo in repositories), clean_streak
+            )
+            if page_size < previous_page_size:
+                print(f"  Resource limits hit, reducing page size to {page_size}")
             
-            # Filter: Check minimum PRs
-            if pr_count < MIN_PRS:
-                print(f"    ✗ {name_with_owner}: {pr_count} PRs (below {MIN_PRS} threshold)")
-                continue
+            if has_next_page:
+                next_page = executor.submit(
+                    fetch_search_page, session, query_template, search_query_string, after_cursor, page_size
+                )
             
-            # Filter: Check minimum issues
-            if issue_count < MIN_ISSUES:
-                print(f"    ✗ {name_with_owner}: {issue_count} issues (below {MIN_ISSUES} threshold)")
-                continue
+            print(f"  Processing {len(repositories)} repositories from this page...")
             
-            # Calculate Python percentage
-            python_percentage = calculate_python_percentage(languages)
+            # Phase 1: filter on the counts returned by the search itself
+            candidates = []
+            for repo in repositories:
+                # Skip if repository data is None (may happen due to resource limit errors)
+                if repo is None:
+                    print(f"    ⚠ Skipping repository with null data (may be due to resource limits)")
+                    continue
+                
+                name_with_owner = repo.get("nameWithOwner", "")
+                if not name_with_owner:
+                    print(f"    ⚠ Skipping repository with missing nameWithOwner")
+                    continue
+                
+                stars = repo.get("stargazerCount", 0)
+                pr_count = repo.get("pullRequests", {}).get("totalCount", 0)
+                issues_data = repo.get("issues")
+                
+                # Handle case where issues data might be None due to resource limits
+                if issues_data is None:
+                    print(f"    ⚠ {name_with_owner}: Issues data unavailable (resource limit)")
+                    continue
+                
+                issue_count = issues_data.get("totalCount", 0)
+                
+                # Filter: Check minimum PRs
+                if pr_count < MIN_PRS:
+                    print(f"    ✗ {name_with_owner}: {pr_count} PRs (below {MIN_PRS} threshold)")
+                    continue
+                
+                # Filter: Check minimum issues
+                if issue_count < MIN_ISSUES:
+                    print(f"    ✗ {name_with_owner}: {issue_count} issues (below {MIN_ISSUES} threshold)")
+                    continue
+                
+                candidates.append((name_with_owner, stars, pr_count, issue_count))
             
-            if python_percentage is None:
-                print(f"    ⚠ {name_with_owner}: No language data available")
-                continue
+            # Accepted repositories are written together at the end of the page
+            page_rows: List[List[Any]] = []
             
-            if python_percentage < PYTHON_PERCENTAGE_THRESHOLD:
-                print(f"    ✗ {name_with_owner}: {python_percentage:.2f}% Python (below threshold)")
-                continue
+            # Phase 2: fetch languages and issue activity for the remaining
+            # repositories only, several repositories per request
+            try:
+                details = fetch_repository_details(
+                    session, details_fragment, [candidate[0] for candidate in candidates]
+                )
+            except Exception as e:
+                print(f"  Error fetching repository details for page {pages_traversed}: {e}")
+                break
             
-            # Check if actively using issues
-            issues_active, last_issue_updated = is_actively_using_issues(issues_data)
+            for name_with_owner, stars, pr_count, issue_count in candidates:
+                if filtered_count >= REPOSITORY_THRESHOLD:
+                    break
+                
+                repo_details = details.get(name_with_owner)
+                if repo_details is None:
+                    print(f"    ⚠ {name_with_owner}: Repository details unavailable (resource limit)")
+                    continue
+                
+                languages = repo_details.get("languages", {})
+                issues_data = repo_details.get("issues")
+                
+                # Calculate Python percentage
+                python_percentage = calculate_python_percentage(languages)
+                
+                if python_percentage is None:
+                    print(f"    ⚠ {name_with_owner}: No language data available")
+                    continue
+                
+                if python_percentage < PYTHON_PERCENTAGE_THRESHOLD:
+                    print(f"    ✗ {name_with_owner}: {python_percentage:.2f}% Python (below threshold)")
+                    continue
+                
+                # Check if actively using issues
+                issues_active, last_issue_updated = is_actively_using_issues(issues_data, activity_cutoff_epoch)
+                
+                # Repository meets all criteria
+                filtered_count += 1
+                repo_info = {
+                    "nameWithOwner": name_with_owner,
+                    "stars": stars,
+                    "python_percentage": python_percentage,
+                    "pr_count": pr_count,
+                    "issue_count": issue_count,
+                    "issues_active": issues_active,
+                    "last_issue_updated": last_issue_updated
+                }
+                
+                page_rows.append(repo_csv_row(repo_info))
+                
+                active_status = "active" if issues_active else "inactive"
+                print(f"    ✓ [{filtered_count}/{REPOSITORY_THRESHOLD}] {name_with_owner}: "
+                      f"{stars} stars, {python_percentage:.2f}% Python, {pr_count} PRs, "
+                      f"{issue_count} issues ({active_status})")
             
-            # Repository meets all criteria
-            filtered_count += 1
-            repo_info = {
-                "nameWithOwner": name_with_owner,
-                "stars": stars,
-                "python_percentage": python_percentage,
-                "pr_count": pr_count,
-                "issue_count": issue_count,
-                "issues_active": issues_active,
-                "last_issue_updated": last_issue_updated
-            }
+            # Make this page's repositories visible on disk before moving on
+            csv_writer.writerows(page_rows)
+            csv_file.flush()
+            print(f"\n  Progress: {filtered_count} repositories found so far")
             
-            # Write to CSV immediately
-            write_repo_to_csv(csv_path, repo_info)
+            if not has_next_page:
+                print("\n  No more pages available.")
+                break
             
-            active_status = "active" if issues_active else "inactive"
-            print(f"    ✓ [{filtered_count}/{REPOSITORY_THRESHOLD}] {name_with_owner}: "
-                  f"{stars} stars, {python_percentage:.2f}% Python, {pr_count} PRs, "
-                  f"{issue_count} issues ({active_status})")
-        
-        print(f"\n  Progress: {filtered_count} repositories found so far")
-        
-        if not has_next_page:
-            print("\n  No more pages available.")
-            break
-        
-        if filtered_count >= REPOSITORY_THRESHOLD:
-            break
-        
-        # Rate limiting: GitHub API allows 5000 requests/hour for authenticated users
-        # We're being conservative with a small delay
-        time.sleep(0.5)
+            if filtered_count >= REPOSITORY_THRESHOLD:
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        csv_file.close()
     
     print("\n" + "=" * 60)
     print(f"Search completed!")
@@ -432,8 +685,9 @@ def main() -> None:
     # Load GitHub token
     token = load_github_token()
     
-    # Load GraphQL query
+    # Load GraphQL queries
     query_template = load_search_query()
+    details_fragment = load_repository_details_fragment()
     
     # Create session with authentication
     session = requests.Session()
@@ -444,7 +698,7 @@ def main() -> None:
     
     # Start searching
     try:
-        search_python_repositories(session, query_template)
+        search_python_repositories(session, query_template, details_fragment)
     except KeyboardInterrupt:
         print("\n\nSearch interrupted by user.")
     except Exception as e:
@@ -0,0 +1,33 @@
+"""
+Retry delays for GitHub API requests, shared by the comment scraper and the
+repository search.
+
+GitHub's own guidance wins: `Retry-After` (secondary rate limits), then
+`X-RateLimit-Reset` when the quota is exhausted. Otherwise the delay is capped
+exponential backoff with full jitter, so parallel workers don't retry in step.
+"""
+
+import random
+import time
+from typing import Optional
+
+import requests
+
+
+BASE_DELAY = 1  # seconds, doubled on every retry
+MAX_DELAY = 60  # seconds, cap for the exponential backoff
+
+
+def backoff_for(response: Optional[requests.Response], attempt: int) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based). Pass the failed
+    response, or None when the request raised before getting one.
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        reset = response.headers.get("X-RateLimit-Reset")
+        if response.headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+            return max(0.0, int(reset) - time.time())
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
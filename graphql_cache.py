@@ -0,0 +1,83 @@
+"""
+Persistent on-disk cache for GitHub GraphQL responses.
+
+Re-running the scraper (e.g. after a crash, or when topping up
+MAX_COMMENTS_PER_REPO) re-requests the same pages with the same query and
+variables. Responses are stored in a SQLite database as zlib-compressed JSON,
+keyed by a SHA-1 of the query text and its variables, and reused until they are
+older than the configured time to live, after which they are fetched again.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+import orjson
+
+
+def request_key(query: str, variables: Dict[str, Any]) -> str:
+    """Cache key of a request: SHA-1 of the query and its variables (sorted by name)."""
+    digest = hashlib.sha1(query.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(orjson.dumps(variables, option=orjson.OPT_SORT_KEYS))
+    return digest.hexdigest()
+
+
+class GraphQLCache:
+    """
+    SQLite-backed GraphQL response cache shared by all threads of a process.
+    A single connection is used, serialised with a lock.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL,
+                    payload BLOB NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+
+    def get(
+        self, query: str, variables: Dict[str, Any], ttl_seconds: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached response data, or None if it is missing or older than
+        ttl_seconds (default: the cache's own time to live).
+        """
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at, payload FROM responses WHERE key = ?",
+                (request_key(query, variables),),
+            ).fetchone()
+        if row is None or time.time() - row[0] > ttl_seconds:
+            return None
+        return orjson.loads(zlib.decompress(row[1]))
+
+    def put(self, query: str, variables: Dict[str, Any], data: Dict[str, Any]) -> None:
+        """Store the response data of a request, replacing any previous entry."""
+        payload = zlib.compress(orjson.dumps(data))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, fetched_at, payload) VALUES (?, ?, ?)",
+                (request_key(query, variables), time.time(), payload),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,3 +1,13 @@
+# Output format blocks shared by the templates below
+OUTPUT_FORMAT_LABEL = """Output Format:
+Label: <useful|not useful> 
+"""
+
+OUTPUT_FORMAT_REASONING_LABEL = """Output Format:
+Reasoning: <concise reasoning>
+Label: <useful|not useful> 
+"""
+
 def few_shot_classification(code, comment):
     return f"""
 Classify the usefulness of the code review comment.
@@ -39,10 +49,7 @@ Current Task
 Code: {code}
 Comment: {comment}
 
-Output Format:
-Reasoning: <concise reasoning>
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_REASONING_LABEL}"""
 
 # ==================================================================================================================================================
 
@@ -88,9 +95,7 @@ Rules:
 - If the analysis concludes the comment is valid/useful/actionable, output 'useful'.
 - If the analysis concludes the comment is subjective/incorrect/trivial, output 'not useful'.
 
-Output Format:
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_LABEL}"""
 
 # ==================================================================================================================================================
 
@@ -146,7 +151,4 @@ New Input
 Review: {comment}
 Code: {code}
 
-Output Format:
-Reasoning: <concise reasoning>
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_REASONING_LABEL}"""
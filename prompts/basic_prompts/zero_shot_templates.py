@@ -1,3 +1,13 @@
+# Output format blocks shared by the templates below
+OUTPUT_FORMAT_LABEL = """Output Format:
+Label: <useful|not useful> 
+"""
+
+OUTPUT_FORMAT_REASONING_LABEL = """Output Format:
+Reasoning: <concise reasoning>
+Label: <useful|not useful> 
+"""
+
 def zero_shot_classification(code, comment):
     return f"""
 You are an expert code review assistant. Your task is to classify whether an inline review comment is useful.
@@ -15,10 +25,7 @@ Instructions:
 2. Think step-by-step: Is the comment factually correct? Is the suggestion actionable? Does it improve quality?
 3. Conclude with the final classification.
 
-Output Format:
-Reasoning: <concise reasoning>
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_REASONING_LABEL}"""
 
 # ==================================================================================================================================================
 
@@ -51,9 +58,7 @@ Analysis: {analysis}
 
 Task: Based strictly on the analysis above, is the comment useful?
 
-Output Format:
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_LABEL}"""
 
 # ==================================================================================================================================================
 
@@ -87,9 +92,7 @@ Rules:
 - If the comment offers a valid optimization mentioned in the Context, output 'true'.
 - If the comment contradicts the Context or is subjective/vague, output 'false'.
 
-Output Format:
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_LABEL}"""
 
 # ==================================================================================================================================================
 
@@ -118,9 +121,7 @@ Instructions:
 3. If the comment satisfies at least one of the criteria in The Standard and is factually correct, the class is 'useful'.
 4. If the comment fails The Standard (is subjective, incorrect, or trivial), the class is 'not useful'.
 
-Output Format:
-Label: <useful|not useful> 
-"""
+{OUTPUT_FORMAT_LABEL}"""
 
 # ==================================================================================================================================================
 
@@ -2,17 +2,20 @@ import dspy
 from signatures import ReviewActionabilityFromComment, ReviewActionabilityWithDiff
 
 class CommentOnlyClassifier(dspy.Module):
-    def __init__(self):
+    def __init__(self, max_tokens=None):
         super().__init__()
-        self.prog = dspy.Predict(ReviewActionabilityFromComment)
+        # The output is a single boolean, so a small max_tokens only stops runaway answers
+        config = {"max_tokens": max_tokens} if max_tokens else {}
+        self.prog = dspy.Predict(ReviewActionabilityFromComment, **config)
 
     def forward(self, review):
         return self.prog(review=review)
     
 class DiffAwareClassifier(dspy.Module):
-    def __init__(self):
+    def __init__(self, max_tokens=None):
         super().__init__()
-        self.prog = dspy.Predict(ReviewActionabilityWithDiff)
+        config = {"max_tokens": max_tokens} if max_tokens else {}
+        self.prog = dspy.Predict(ReviewActionabilityWithDiff, **config)
 
     def forward(self, review, codeDiff):
         return self.prog(review=review, codeDiff=codeDiff)
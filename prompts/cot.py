@@ -7,12 +7,10 @@ class CommentOnlyActionabilityClassifier(dspy.Module):
         self.cot = dspy.ChainOfThought(
             ReviewActionabilityFromComment,
             instructions=(
-                "Reason step by step about whether the review comment is actionable.\n"
-                "Mark useful=True if:\n"
-                "- The comment identifies a concrete issue (bug, risk, performance, edge case, or maintainability concern), AND\n"
-                "- The author could reasonably act on it.\n"
-                "Mark useful=False if:\n"
-                "- The comment is vague, generic, purely stylistic, praise, or meta discussion."
+                "Decide whether the review comment is actionable.\n"
+                "useful=True iff it names a concrete issue (bug, risk, performance, edge case, maintainability) "
+                "AND the author can act on it.\n"
+                "useful=False if vague, generic, purely stylistic, praise, or meta discussion."
             )
         )
 
@@ -26,16 +24,12 @@ class DiffAwareActionabilityClassifier(dspy.Module):
         self.cot = dspy.ChainOfThought(
             ReviewActionabilityWithDiff,
             instructions=(
-                "Reason step by step about the relationship between the code diff and the review comment.\n"
-                "Mark useful=True if:\n"
-                "- The comment refers to something present or implied in the diff, AND\n"
-                "- It identifies a concrete issue (bug, risk, performance, edge case, or maintainability concern), AND\n"
-                "- The author could reasonably act on the comment given the diff.\n"
-                "Mark useful=False if:\n"
-                "- The comment is generic or not grounded in the diff,\n"
-                "- It is vague, subjective, or purely stylistic without guidance,\n"
-                "- It is praise or meta discussion,\n"
-                "- Or it refers to code not shown in the diff."
+                "Decide whether the review comment is actionable given the code diff.\n"
+                "useful=True iff it refers to something present or implied in the diff, "
+                "names a concrete issue (bug, risk, performance, edge case, maintainability), "
+                "AND the author can act on it given the diff.\n"
+                "useful=False if generic or not grounded in the diff; vague, subjective, or purely "
+                "stylistic without guidance; praise or meta discussion; or about code not in the diff."
             )
         )
 
@@ -4,7 +4,7 @@ import dspy
 from dspy.teleprompt import KNNFewShot
 from sentence_transformers import SentenceTransformer
 from scripts.load_examples_from_json import load_examples_from_json
-from validate_answers import normalize_bool
+from validate_answers import score_predictions
 from cot import DiffAwareActionabilityClassifier  
 from sklearn.metrics import classification_report, confusion_matrix
 
@@ -19,7 +19,8 @@ if __name__ == "__main__":
         api_key=config.API_KEY,
         temperature=config.TEMPERATURE,
         max_tokens=config.MAX_TOKENS,
-        cache=config.CACHE_ENABLED     
+        cache=config.CACHE_ENABLED,
+        **config.PROMPT_CACHE_KWARGS
     )
     dspy.configure(lm=lm)
 
@@ -38,20 +39,13 @@ if __name__ == "__main__":
 
     compiled_program = knn_optimizer.compile(program)
 
-    predictions = []
-    true_labels = []
-    pred_labels = []
+    # Classify the whole evaluation set concurrently; predictions come back
+    # in testset order, with None for examples whose LM call failed
+    predictions = compiled_program.batch(testset, num_threads=config.NUM_THREADS)
 
-    for i, test in enumerate(testset):
-        pred = compiled_program(review=test.review, codeDiff=test.codeDiff)
-        predictions.append(pred)
-
-        t_val = normalize_bool(test.useful)
-        p_val = normalize_bool(pred.useful)
-
-        true_labels.append(t_val)
-        pred_labels.append(p_val)
+    indices, true_labels, pred_labels = score_predictions(testset, predictions)
 
+    for i, t_val, p_val in zip(indices, true_labels, pred_labels):
         print(f"{i+1} Real: {t_val} Pred: {p_val}")
 
 
@@ -61,6 +55,5 @@ if __name__ == "__main__":
     print("\nConfusion Matrix:")
     print(confusion_matrix(true_labels, pred_labels))
 
-    if hasattr(lm, "inspect_history"):
-        print("\nLast LM call history:")
-        print(lm.inspect_history(n=1))
+    print("\nLast LM call history:")
+    print(lm.inspect_history(n=1))
@@ -3,7 +3,7 @@ import os
 import argparse
 import dspy
 from scripts.load_examples_from_json import load_examples_from_json
-from validate_answers import normalize_bool
+from validate_answers import score_predictions
 from classifiers import DiffAwareClassifier
 from cot import DiffAwareActionabilityClassifier
 from sklearn.metrics import classification_report, confusion_matrix
@@ -19,29 +19,27 @@ def main(use_cot):
         api_key=config.API_KEY,
         temperature=config.TEMPERATURE,
         max_tokens=config.MAX_TOKENS,
-        cache=config.CACHE_ENABLED     
+        cache=config.CACHE_ENABLED,
+        **config.PROMPT_CACHE_KWARGS
     )
     dspy.configure(lm=lm)
 
     testset = load_examples_from_json(config.EVALUATION_SET_PATH)
     
-    program = DiffAwareActionabilityClassifier() if use_cot else DiffAwareClassifier()
+    program = (
+        DiffAwareActionabilityClassifier() if use_cot
+        else DiffAwareClassifier(max_tokens=config.MAX_TOKENS_BOOL)
+    )
     compiled = program 
 
-    true_labels = []
-    pred_labels = []
-
-    for i, test in enumerate(testset):
-        prediction = compiled(review=test.review, codeDiff=test.codeDiff)
+    # Classify the whole evaluation set concurrently; predictions come back
+    # in testset order, with None for examples whose LM call failed
+    predictions = compiled.batch(testset, num_threads=config.NUM_THREADS)
 
-        t_val = normalize_bool(test.useful)
-        p_val = normalize_bool(prediction.useful)
-
-        true_labels.append(t_val)
-        pred_labels.append(p_val)
+    indices, true_labels, pred_labels = score_predictions(testset, predictions)
 
+    for i, t_val, p_val in zip(indices, true_labels, pred_labels):
         print(f"{i+1}  Real:{t_val}  Pred:{p_val}")
-        print(lm.inspect_history(n=1)) 
 
     print("\nClassification report:")
     print(classification_report(true_labels, pred_labels, digits=3))
@@ -49,6 +47,9 @@ def main(use_cot):
     print("\nConfusion Matrix:")
     print(confusion_matrix(true_labels, pred_labels))
 
+    print("\nLast LM call history:")
+    print(lm.inspect_history(n=1))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -1,8 +1,11 @@
+TRUE_STRINGS = frozenset(("true", "yes", "1"))
+
+
 def normalize_bool(val):
     if isinstance(val, bool):
         return val
     if isinstance(val, str):
-        return val.strip().lower() in ["true", "yes", "1"]
+        return val.strip().lower() in TRUE_STRINGS
     return False
 
 
@@ -13,4 +16,27 @@ def validate_answer(example, pred, trace=None):
     pred_val = pred.useful
     true_val = example.useful
 
-    return normalize_bool(pred_val) == normalize_bool(true_val)
\ No newline at end of file
+    return normalize_bool(pred_val) == normalize_bool(true_val)
+
+
+def score_predictions(testset, predictions):
+    """
+    Pair each example with its prediction from Module.batch() (same order) and
+    return (indices, true_labels, pred_labels) for the examples that got one.
+    Examples whose LM call failed come back as None; they are left out of the
+    labels rather than scored as "not useful", and a warning gives their count.
+    """
+    scored = [
+        (i, normalize_bool(test.useful), normalize_bool(prediction.useful))
+        for i, (test, prediction) in enumerate(zip(testset, predictions))
+        if prediction is not None
+    ]
+
+    failed_count = len(testset) - len(scored)
+    if failed_count:
+        print(f"Warning: {failed_count}/{len(testset)} examples failed and are excluded from the report")
+
+    if not scored:
+        return [], [], []
+    indices, true_labels, pred_labels = map(list, zip(*scored))
+    return indices, true_labels, pred_labels
\ No newline at end of file
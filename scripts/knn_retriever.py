@@ -1,29 +1,49 @@
 import dspy
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from scripts.load_examples_from_json import load_examples_from_json
 
 class KNN:
+    """
+    Retrieves the k trainset examples most similar to a query (cosine similarity
+    over "diffHunk commentText" embeddings).
+
+    `vectorizer` must take a list of texts and return one vector per text, i.e. an
+    array of shape (len(texts), dim), e.g. SentenceTransformer.encode or dspy.Embedder.
+    A vectorizer that embeds a single text is not supported.
+    """
+
     def __init__(self, k, trainset, vectorizer):
         self.k = k
         self.trainset = trainset
         self.vectorizer = vectorizer
         
-        self.train_vectors = []
-        for example in self.trainset:
-            text_to_embed = f"{example.diffHunk} {example.commentText}"
-            self.train_vectors.append(self.vectorizer(text_to_embed))
-        
-        self.train_vectors = np.array(self.train_vectors)
+        # Embed the whole trainset in one batched call
+        texts_to_embed = [f"{example.diffHunk} {example.commentText}" for example in self.trainset]
+        self.train_vectors = self._embed(texts_to_embed)
+        # Normalize once, so cosine similarity is a plain dot product. The norm is
+        # clamped like sklearn's cosine_similarity, so all-zero vectors score 0, not NaN
+        norms = np.linalg.norm(self.train_vectors, axis=1, keepdims=True)
+        self.train_vectors = self.train_vectors / np.maximum(norms, 1e-12)
+
+    def _embed(self, texts):
+        vectors = np.asarray(self.vectorizer(texts), dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+            raise ValueError(
+                f"vectorizer must return one vector per text, got shape {vectors.shape} for {len(texts)} texts"
+            )
+        return vectors
 
     def __call__(self, **kwargs):
         input_diff = kwargs.get('diffHunk', '')
         input_comment = kwargs.get('commentText', '')
 
         query_text = f"{input_diff} {input_comment}"    
-        query_vector = np.array([self.vectorizer(query_text)])
+        query_vector = self._embed([query_text])[0]
+        query_vector = query_vector / np.maximum(np.linalg.norm(query_vector), 1e-12)
 
-        scores = cosine_similarity(query_vector, self.train_vectors)[0]
-        top_k_indices = scores.argsort()[-self.k:][::-1]
+        scores = self.train_vectors @ query_vector
+        k = min(self.k, len(scores))
+        top_k_indices = np.argpartition(scores, -k)[-k:]
+        top_k_indices = top_k_indices[np.argsort(-scores[top_k_indices])]
 
         return [self.trainset[i] for i in top_k_indices]
@@ -1,12 +1,12 @@
-import json
 import dspy
+import orjson
 
 
 def load_examples_from_json(json_path):
     examples = []
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(json_path, "rb") as f:
+        data = orjson.loads(f.read())
 
     for item in data:
         resolved = item.get("resolved")
@@ -1,15 +1,91 @@
+import atexit
+import functools
+import hashlib
+import sqlite3
+import threading
 import numpy as np
-import pickle
+import orjson
 import json
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-EMBEDDINGS_FILE = "review_embeddings.pkl"
+EMBEDDINGS_FILE = "review_embeddings.npy"
+METADATA_FILE = "review_metadata.json"
+QUERY_CACHE_FILE = "query_embeddings.sqlite3"
+QUERY_CACHE_MEMORY_SIZE = 4096
+ENCODE_BATCH_SIZE = 256
+
+_model = None
+_query_cache = None
+_query_cache_lock = threading.Lock()
+_stored_payload = None
+
+
+def get_model():
+    """Loads the embedding model on first use and reuses it for every later call."""
+    global _model
+    if _model is None:
+        _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
+
+
+def get_query_cache():
+    """
+    Opens the on-disk query embedding cache on first use.
+    The single connection is shared by all threads; callers must hold _query_cache_lock.
+    """
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = sqlite3.connect(QUERY_CACHE_FILE, check_same_thread=False)
+        _query_cache.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        _query_cache.commit()
+    return _query_cache
+
+
+@atexit.register
+def close_query_cache():
+    """Closes the on-disk query embedding cache; it is reopened on next use."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is not None:
+            _query_cache.close()
+            _query_cache = None
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_MEMORY_SIZE)
+def embed_query(text):
+    """
+    Returns the normalized float32 embedding of a query text (read-only).
+    Embeddings are cached in memory and on disk, keyed by a SHA-256 of the
+    model name and the text, so repeated queries skip the forward pass.
+    """
+    key = hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\0{text}".encode("utf-8")).digest()
+    with _query_cache_lock:
+        row = get_query_cache().execute(
+            "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+    if row is not None:
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    vector = get_model().encode(
+        [text], normalize_embeddings=True, show_progress_bar=False
+    )[0].astype(np.float32)
+    vector.setflags(write=False)
+    with _query_cache_lock:
+        cache = get_query_cache()
+        cache.execute(
+            "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+            (key, vector.tobytes()),
+        )
+        cache.commit()
+    return vector
+
 
 def embed_and_store(json_file_path):
     """Reads a JSON file, embeds the 'commentText' and stores embeddings + metadata on disk."""
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    model = get_model()
 
     with open(json_file_path, 'r') as f:
         data = json.load(f)
@@ -22,7 +98,15 @@ def embed_and_store(json_file_path):
         return
 
     print(f"Embedding {len(comments)} comments.")
-    embeddings = model.encode(comments, normalize_embeddings=True)
+    embeddings = np.asarray(
+        model.encode(
+            comments,
+            batch_size=ENCODE_BATCH_SIZE,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ),
+        dtype=np.float16,
+    )
 
     stored_data = []
     for item in valid_data:
@@ -32,38 +116,61 @@ def embed_and_store(json_file_path):
             "resolved": item.get("resolved") 
         })
 
-    payload = {
-        "embeddings": embeddings,
+    # Embeddings are stored as float16 (half the size of float32, plenty of
+    # precision for ranking), metadata as JSON next to them
+    np.save(EMBEDDINGS_FILE, embeddings)
+    with open(METADATA_FILE, "wb") as f:
+        f.write(orjson.dumps(stored_data))
+
+    global _stored_payload
+    _stored_payload = {
+        "embeddings": embeddings.astype(np.float32),
         "data": stored_data
     }
 
-    with open(EMBEDDINGS_FILE, "wb") as f:
-        pickle.dump(payload, f)
-
     print(f"Saved {len(stored_data)} embeddings to {EMBEDDINGS_FILE}")
 
 
+def load_stored_embeddings():
+    """
+    Loads the stored embeddings + metadata on first use and keeps them for later calls.
+    Returns None if EMBEDDINGS_FILE or METADATA_FILE does not exist yet.
+    """
+    global _stored_payload
+    if _stored_payload is None:
+        try:
+            embeddings = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+            with open(METADATA_FILE, "rb") as f:
+                stored_data = orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+        # Widened once here, since numpy has no BLAS kernel for float16 products
+        _stored_payload = {
+            "embeddings": embeddings.astype(np.float32),
+            "data": stored_data
+        }
+    return _stored_payload
+
+
 def retrieve_top_k(new_comment_text, k=3):
     """Embeds a new comment text and retrieves the top-k most similar stored examples."""
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-    try:
-        with open(EMBEDDINGS_FILE, "rb") as f:
-            payload = pickle.load(f)
-    except FileNotFoundError:
+    payload = load_stored_embeddings()
+    if payload is None:
         print(f"Error: {EMBEDDINGS_FILE} not found. Run embed_and_store() first.")
         return []
 
     stored_embeddings = payload["embeddings"]
     stored_data = payload["data"]
 
-    query_embedding = model.encode(
-        [new_comment_text],
-        normalize_embeddings=True
-    )
+    # Stored and query embeddings are both normalized, so cosine similarity
+    # is a plain dot product
+    similarities = stored_embeddings @ embed_query(new_comment_text)
 
-    similarities = cosine_similarity(query_embedding, stored_embeddings)[0]
-    top_k_indices = np.argsort(similarities)[::-1][:k]
+    k = min(k, len(similarities))
+    if k <= 0:
+        return []
+    top_k_indices = np.argpartition(similarities, -k)[-k:]
+    top_k_indices = top_k_indices[np.argsort(similarities[top_k_indices])[::-1]]
 
     results = []
     for idx in top_k_indices:
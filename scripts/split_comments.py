@@ -1,16 +1,24 @@
 import json
 import os
+import orjson
 
 def split_comments_by_resolved(filename, output_folder='comments'):
     """Splits a JSON file into 'resolved' and 'unresolved' files."""
 
     os.makedirs(output_folder, exist_ok=True)
     
-    with open(filename, 'r') as f:
-        data = json.load(f)
+    with open(filename, 'rb') as f:
+        data = orjson.loads(f.read())
     
-    resolved = [item for item in data if item.get('resolved') is True]
-    unresolved = [item for item in data if item.get('resolved') is False]
+    # Single pass; items without a boolean 'resolved' go to neither file
+    resolved = []
+    unresolved = []
+    for item in data:
+        state = item.get('resolved')
+        if state is True:
+            resolved.append(item)
+        elif state is False:
+            unresolved.append(item)
     
     with open(os.path.join(output_folder, 'resolved_comments.json'), 'w') as f:
         json.dump(resolved, f, indent=2)